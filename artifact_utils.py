@@ -0,0 +1,182 @@
+import os
+import shutil
+import time
+from subprocess import TimeoutExpired
+from concurrent.futures import ThreadPoolExecutor
+from os.path import normpath, basename
+from pathlib import Path
+
+import zstandard
+
+from tracing_utils import traced
+from utils import upload_artifact
+
+
+ARTIFACT_COMPRESSION_LEVEL = 10
+ARTIFACT_READ_CHUNK_SIZE = 4 * 1024 * 1024
+ARTIFACT_UPLOAD_WORKERS = 4
+# a failed upload is recorded in the results instead of aborting the test after the sync
+UPLOAD_ERRORS = (RuntimeError, OSError, TimeoutExpired)
+
+
+class SplitFileWriter:
+    # writes <base_path> or, when a part_size is set, <base_path>.000, <base_path>.001, ...
+    # (concatenating the parts gives back a valid zstd frame)
+    def __init__(self, base_path, part_size=None, on_part_closed=None):
+        self.base_path = str(base_path)
+        self.part_size = part_size
+        self.on_part_closed = on_part_closed
+        self.parts = []
+        self.file = None
+        self.part_bytes = 0
+
+    def _open_next_part(self):
+        self._close_part()
+        part_path = self.base_path if not self.part_size else f"{self.base_path}.{len(self.parts):03d}"
+        self.file = open(part_path, "wb")
+        self.parts.append(part_path)
+        self.part_bytes = 0
+
+    def _close_part(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            if self.on_part_closed:
+                self.on_part_closed(self.parts[-1])
+
+    def write(self, data):
+        data = memoryview(data)
+        written = 0
+        while written < len(data):
+            if self.file is None or (self.part_size and self.part_bytes >= self.part_size):
+                self._open_next_part()
+            chunk_size = len(data) - written
+            if self.part_size:
+                chunk_size = min(chunk_size, self.part_size - self.part_bytes)
+            self.file.write(data[written:written + chunk_size])
+            self.part_bytes += chunk_size
+            written += chunk_size
+        return written
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        if self.file is None and not self.parts:
+            # empty input - still produce one (empty) part
+            self._open_next_part()
+        self._close_part()
+
+
+class BuildkiteUploader:
+    name = "buildkite"
+
+    def upload(self, file_path):
+        upload_artifact(file_path, timeout=1800)
+
+
+class LocalUploader:
+    name = "local"
+
+    def __init__(self, destination_dir):
+        self.destination_dir = Path(destination_dir)
+        self.destination_dir.mkdir(parents=True, exist_ok=True)
+
+    def upload(self, file_path):
+        shutil.copy2(file_path, self.destination_dir / basename(normpath(file_path)))
+
+
+def get_uploader(uploader_name, destination_dir=None):
+    if uploader_name == "buildkite":
+        return BuildkiteUploader()
+    elif uploader_name == "local":
+        return LocalUploader(destination_dir or "uploaded_artifacts")
+    elif uploader_name in (None, "none"):
+        return None
+    else:
+        raise Exception(f"Unknown artifacts uploader: {uploader_name}")
+
+
+@traced
+def compress_file_zstd(file_path, output_dir=".", part_size=None, level=ARTIFACT_COMPRESSION_LEVEL,
+                       on_part_closed=None):
+    file_name = basename(normpath(file_path))
+    archive_path = Path(output_dir) / f"{file_name}.zst"
+    print(f"Compressing {file_path} into {archive_path} (zstd level {level}, part size: {part_size})")
+
+    start_compression = time.perf_counter()
+    # threads=-1 -> one compression worker per logical cpu
+    compressor = zstandard.ZstdCompressor(level=level, threads=-1, write_content_size=False)
+    split_writer = SplitFileWriter(archive_path, part_size, on_part_closed)
+    with open(file_path, "rb") as in_file:
+        with compressor.stream_writer(split_writer, closefd=False) as zstd_writer:
+            while True:
+                chunk = in_file.read(ARTIFACT_READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                zstd_writer.write(chunk)
+    split_writer.close()
+    compression_time = time.perf_counter() - start_compression
+
+    original_size = os.path.getsize(file_path)
+    compressed_size = sum(os.path.getsize(part) for part in split_writer.parts)
+    return {
+        "file": file_name,
+        "parts": [basename(part) for part in split_writer.parts],
+        "original_size_in_bytes": original_size,
+        "compressed_size_in_bytes": compressed_size,
+        "compression_ratio": round(original_size / compressed_size, 2) if compressed_size else None,
+        "compression_time_in_sec": round(compression_time, 3),
+    }
+
+
+@traced
+def pack_and_upload_artifacts(file_paths, uploader=None, output_dir=".", part_size=None,
+                              max_workers=ARTIFACT_UPLOAD_WORKERS):
+    # the parts are uploaded (in parallel) as soon as they are closed, while the compression goes on
+    artifacts = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        def upload_part(part_path):
+            start_upload = time.perf_counter()
+            try:
+                uploader.upload(part_path)
+            except UPLOAD_ERRORS as e:
+                print(f" !!! ERROR: could not upload {part_path}: {e}")
+                return time.perf_counter() - start_upload, f"{basename(part_path)}: {e}"
+            return time.perf_counter() - start_upload, None
+
+        def submit_upload(part_path):
+            if uploader is not None:
+                upload_futures.append(executor.submit(upload_part, part_path))
+
+        for file_path in file_paths:
+            if not os.path.isfile(file_path):
+                print(f" !!! ERROR: artifact file not found: {file_path}")
+                continue
+            upload_futures = []
+            artifact = compress_file_zstd(file_path, output_dir, part_size, on_part_closed=submit_upload)
+            artifact["upload_futures"] = upload_futures
+            artifacts.append(artifact)
+
+        for artifact in artifacts:
+            upload_results = [future.result() for future in artifact.pop("upload_futures")]
+            if uploader is not None:
+                artifact["uploader"] = uploader.name
+                artifact["upload_time_in_sec"] = round(sum(t for t, _ in upload_results), 3)
+                artifact["upload_errors"] = [error for _, error in upload_results if error]
+            print(f"Artifact {artifact['file']}: ratio {artifact['compression_ratio']}, "
+                  f"compression time {artifact['compression_time_in_sec']}s, parts: {artifact['parts']}")
+    return artifacts
+
+
+def upload_files(uploader, file_paths):
+    # returns the upload errors by file name
+    upload_errors = {}
+    for file_path in file_paths:
+        try:
+            uploader.upload(file_path)
+        except UPLOAD_ERRORS as e:
+            print(f" !!! ERROR: could not upload {file_path}: {e}")
+            upload_errors[basename(normpath(file_path))] = str(e)
+    return upload_errors
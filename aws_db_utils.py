@@ -1,9 +1,18 @@
 import os
+import re
 
+import numpy as np
 import pymysql.cursors
 import pandas as pd
 
+from tracing_utils import traced
 
+
+STREAM_BATCH_SIZE = 10000
+SQL_IDENTIFIER_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+@traced
 def create_connection():
     conn = None
     try:
@@ -19,6 +28,7 @@ def create_connection():
     return conn
 
 
+@traced
 def create_table(table_sql_query):
     conn = create_connection()
     try:
@@ -34,6 +44,25 @@ def create_table(table_sql_query):
             conn.close()
 
 
+@traced
+def execute_sql_query(sql_query, params=None):
+    conn = create_connection()
+    print(f"  -- sql_query: {sql_query}, params: {params}")
+    try:
+        cur = conn.cursor()
+        affected_rows_no = cur.execute(sql_query, params)
+        conn.commit()
+        cur.close()
+        return affected_rows_no
+    except Exception as e:
+        print(f"!!! ERROR: Failed to execute query {sql_query} --> {e}")
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+
+@traced
 def drop_table(table_name):
     conn = create_connection()
     sql_query = f"DROP TABLE {table_name};"
@@ -42,6 +71,7 @@ def drop_table(table_name):
         cur.execute(sql_query)
         conn.commit()
         cur.close()
+        _table_columns_cache.pop(table_name, None)
     except Exception as e:
         print(f"!!! ERROR: Failed to drop table {table_name}: {e}")
         return False
@@ -50,17 +80,27 @@ def drop_table(table_name):
             conn.close()
 
 
-def get_column_names_from_table(table_name):
+# table name -> column names, filled from information_schema once per run and kept up to date
+# by add_columns_to_table()
+_table_columns_cache = {}
+
+
+@traced
+def get_column_names_from_table(table_name, use_cache=True):
+    if use_cache and table_name in _table_columns_cache:
+        return list(_table_columns_cache[table_name])
     print(f"Getting the column names from table: {table_name}")
 
     conn = create_connection()
-    sql_query = f"select * from {table_name}"
+    sql_query = "SELECT COLUMN_NAME FROM information_schema.COLUMNS " \
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s ORDER BY ORDINAL_POSITION"
     print(f"  -- sql_query: {sql_query}")
     try:
         cur = conn.cursor()
-        cur.execute(sql_query)
-        col_name_list = [res[0] for res in cur.description]
-        return col_name_list
+        cur.execute(sql_query, (table_name,))
+        col_name_list = [res[0] for res in cur.fetchall()]
+        _table_columns_cache[table_name] = col_name_list
+        return list(col_name_list)
     except Exception as e:
         print(f"!!! ERROR: Failed to get column names from table: {table_name}: {e}")
         return False
@@ -69,23 +109,57 @@ def get_column_names_from_table(table_name):
             conn.close()
 
 
-def add_column_to_table(table_name, column_name, column_type):
-    print(f"Adding column {column_name} with type {column_type} to {table_name} table")
+@traced
+def add_columns_to_table(table_name, columns):
+    # columns: list of (column_name, column_type) - all added with a single ALTER TABLE statement
+    print(f"Adding columns {[c[0] for c in columns]} to {table_name} table")
 
     conn = create_connection()
-    sql_query = f"alter table {table_name} add column {column_name} {column_type}"
-    print(f"  -- sql_query: {sql_query}")
+    add_columns = ", ".join(f"ADD COLUMN {column_name} {column_type}" for column_name, column_type in columns)
+    sql_query = f"ALTER TABLE {table_name} {add_columns}"
     try:
         cur = conn.cursor()
-        cur.execute(sql_query)
+        try:
+            # no table rebuild when the server supports instant ADD COLUMN (MySQL >= 8.0.12)
+            print(f"  -- sql_query: {sql_query}, ALGORITHM=INSTANT")
+            cur.execute(f"{sql_query}, ALGORITHM=INSTANT")
+        except pymysql.err.MySQLError as e:
+            print(f"  -- instant ADD COLUMN not possible ({e}), falling back to the default algorithm")
+            cur.execute(sql_query)
+        conn.commit()
+        # a table that is not cached yet is read from information_schema on the next lookup
+        if table_name in _table_columns_cache:
+            _table_columns_cache[table_name].extend(c[0] for c in columns)
+        return True
     except Exception as e:
-        print(f"!!! ERROR: Failed to add {column_name} column into table {table_name} --> {e}")
+        print(f"!!! ERROR: Failed to add columns {[c[0] for c in columns]} into table {table_name} --> {e}")
         return False
     finally:
         if conn:
             conn.close()
 
 
+@traced
+def add_column_to_table(table_name, column_name, column_type):
+    return add_columns_to_table(table_name, [(column_name, column_type)])
+
+
+@traced
+def ensure_table_columns(table_name, columns):
+    # adds (in one statement) only the columns that are missing - so the table is altered at most once
+    table_column_names = get_column_names_from_table(table_name)
+    if table_column_names is False:
+        return False
+    missing_columns = []
+    for column_name, column_type in columns:
+        if column_name not in table_column_names and column_name not in [c[0] for c in missing_columns]:
+            missing_columns.append((column_name, column_type))
+    if not missing_columns:
+        return True
+    return add_columns_to_table(table_name, missing_columns)
+
+
+@traced
 def add_single_value_into_db(table_name, col_names_list, col_values_list):
     print(f"Adding 1 new entry into {table_name} table")
     initial_rows_no = get_last_row_no(table_name)
@@ -110,6 +184,7 @@ def add_single_value_into_db(table_name, col_names_list, col_values_list):
     return True
 
 
+@traced
 def add_bulk_values_into_db(table_name, col_names_list, col_values_list):
     print(f"Adding {len(col_values_list)} entries into {table_name} table")
     initial_rows_no = get_last_row_no(table_name)
@@ -134,6 +209,7 @@ def add_bulk_values_into_db(table_name, col_names_list, col_values_list):
     return True
 
 
+@traced
 def get_last_row_no(table_name):
     print(f"Getting the no of rows from table: {table_name}")
 
@@ -153,6 +229,7 @@ def get_last_row_no(table_name):
             conn.close()
 
 
+@traced
 def get_identifier_last_run_from_table(table_name):
     print(f"Getting the Identifier value of the last run from table {table_name}")
 
@@ -176,6 +253,7 @@ def get_identifier_last_run_from_table(table_name):
                 conn.close()
 
 
+@traced
 def get_last_epoch_no_from_table(table_name):
     print(f"Getting the last epoch no value from table {table_name}")
 
@@ -198,23 +276,87 @@ def get_last_epoch_no_from_table(table_name):
                 conn.close()
 
 
-def get_column_values(table_name, column_name):
+def check_sql_identifier(name):
+    # table/column names can not be passed as query parameters
+    if not SQL_IDENTIFIER_RE.match(str(name)):
+        raise ValueError(f"Invalid SQL identifier: {name}")
+    return name
+
+
+def build_select_query(table_name, column_names, identifier=None, start_time=None, end_time=None,
+                       time_column="timestamp", order_by=None):
+    # identifier: a single run identifier or a list of them; start_time/end_time: inclusive/exclusive bounds
+    check_sql_identifier(table_name)
+    select_columns = ", ".join(check_sql_identifier(c) for c in column_names)
+    conditions = []
+    params = []
+    if identifier is not None:
+        identifiers = [identifier] if isinstance(identifier, str) else list(identifier)
+        conditions.append(f"identifier IN ({', '.join(['%s'] * len(identifiers))})")
+        params.extend(identifiers)
+    if start_time is not None:
+        conditions.append(f"{check_sql_identifier(time_column)} >= %s")
+        params.append(start_time)
+    if end_time is not None:
+        conditions.append(f"{check_sql_identifier(time_column)} < %s")
+        params.append(end_time)
+    sql_query = f"SELECT {select_columns} FROM {table_name}"
+    if conditions:
+        sql_query += " WHERE " + " AND ".join(conditions)
+    if order_by:
+        sql_query += f" ORDER BY {check_sql_identifier(order_by)}"
+    return sql_query, params
+
+
+def iter_query_rows(sql_query, params=None, batch_size=STREAM_BATCH_SIZE):
+    # unbuffered (server side) cursor - only batch_size rows are held in memory at a time
+    conn = create_connection()
+    print(f"  -- sql_query: {sql_query}, params: {params}")
+    try:
+        cur = conn.cursor(pymysql.cursors.SSCursor)
+        cur.execute(sql_query, params)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        # closing the connection (not the cursor) so an early stop does not read the remaining rows
+        if conn:
+            conn.close()
+
+
+def iter_column_values(table_name, column_name, identifier=None, start_time=None, end_time=None,
+                       batch_size=STREAM_BATCH_SIZE, dtype=None):
+    sql_query, params = build_select_query(table_name, [column_name], identifier, start_time, end_time)
+    for rows in iter_query_rows(sql_query, params, batch_size):
+        yield np.array([row[0] for row in rows], dtype=dtype)
+
+
+def iter_table_chunks(table_name, column_names, identifier=None, start_time=None, end_time=None,
+                      batch_size=STREAM_BATCH_SIZE, time_column="timestamp", order_by=None):
+    sql_query, params = build_select_query(table_name, column_names, identifier, start_time, end_time,
+                                           time_column, order_by)
+    for rows in iter_query_rows(sql_query, params, batch_size):
+        yield pd.DataFrame.from_records(rows, columns=column_names)
+
+
+@traced
+def get_column_values(table_name, column_name, identifier=None, start_time=None, end_time=None):
     print(f"Getting {column_name} column values from table {table_name}")
 
-    conn = create_connection()
-    sql_query = f"SELECT {column_name} FROM {table_name};"
     try:
-        cur = conn.cursor()
-        cur.execute(sql_query)
-        return [el[0] for el in cur.fetchall()]
+        values = []
+        for rows in iter_query_rows(*build_select_query(table_name, [column_name], identifier,
+                                                        start_time, end_time)):
+            values.extend(row[0] for row in rows)
+        return values
     except Exception as e:
         print(f"!!! ERROR: Failed to get {column_name} column values from table {table_name} --> {e}")
         return False
-    finally:
-        if conn:
-            conn.close()
 
 
+@traced
 def delete_all_rows_from_table(table_name):
     print(f"Deleting all entries from table: {table_name}")
     conn = create_connection()
@@ -236,6 +378,7 @@ def delete_all_rows_from_table(table_name):
     print(f"Successfully deleted {initial_rows_no - final_rows_no} rows from table {table_name}")
 
 
+@traced
 def delete_record(table_name, column_name, delete_value):
     print(f"Deleting rows containing '{delete_value}' value inside the '{column_name}' column")
     initial_rows_no = get_last_row_no(table_name)
@@ -259,6 +402,7 @@ def delete_record(table_name, column_name, delete_value):
     print(f"Successfully deleted {initial_rows_no - final_rows_no} rows from table {table_name}")
 
 
+@traced
 def add_bulk_csv_to_table(table_name, csv_path):
     df = pd.read_csv(csv_path)
     # replace nan/empty values with "None"
@@ -22,7 +22,20 @@ from git import Repo
 from psutil import process_iter
 from utils import seconds_to_time, date_diff_in_seconds, get_no_of_cpu_cores, \
     get_current_date_time, get_os_type, get_directory_size, get_total_ram_in_GB, \
-    upload_artifact, clone_repo, print_file, stop_process, export_env_var, create_dir, zip_file
+    upload_artifact, clone_repo, print_file, stop_process, stop_process_gracefully, export_env_var, create_dir, zip_file, \
+    get_process_resources, checkout_repo_from_mirror, get_cache_dir, is_process_running, tail_file
+from postgres_utils import create_db_sync_connection, export_table, export_tables, get_epoch_sync_times, \
+    get_era_stats, get_epoch_block_stats, has_tables
+from run_archive import RunArchiveWriter, get_run_files, RUN_ARCHIVE_DIR_NAME
+from log_tailer import LogTailer
+from metrics_scraper import MetricsScraper, NODE_METRICS_URL, DB_SYNC_METRICS_URL
+from snapshot_utils import capture_db_sync_snapshot, restore_db_sync_snapshot
+from artifact_utils import get_uploader, pack_and_upload_artifacts, upload_files
+from isolation_utils import apply_service_isolation, build_isolation_layout, drop_page_cache, \
+    get_numactl_prefix, isolated_processes_per_service, HARNESS_SERVICE_NAME
+from sync_progress import SyncProgressModel, SyncStalledError, STALL_TIMEOUT_SECONDS
+from epoch_analysis import analyze_epoch_sync_times
+from tracing_utils import get_phase_durations, traced, write_chrome_trace, TRACE_FILE_NAME
 
 
 ROOT_TEST_PATH = Path.cwd()
@@ -30,8 +43,20 @@ ROOT_TEST_PATH = Path.cwd()
 NODE_LOG_FILE_PATH = f"{ROOT_TEST_PATH}/cardano-node/node_logfile.log"
 DB_SYNC_LOG_FILE_PATH = f"{ROOT_TEST_PATH}/cardano-db-sync/db_sync_logfile.log"
 TEST_RESULTS_FILE_NAME = 'test_results.json'
-EPOCH_SYNC_TIMES_FILE_NAME = 'epoch_sync_times_dump.json'
+EPOCH_SYNC_TIMES_FILE_NAME = 'epoch_sync_times_dump.ndjson.zst'
 EPOCH_SYNC_TIMES_FILE_PATH = f"{ROOT_TEST_PATH}/cardano-db-sync/{EPOCH_SYNC_TIMES_FILE_NAME}"
+STALL_DIAGNOSTICS_FILE_NAME = 'stall_diagnostics.json'
+DB_SYNC_TABLES_READ_AFTER_SYNC = ['block', 'epoch_sync_time']
+# cpu sets / NUMA nodes / io priorities of the services (set when running with --isolate)
+isolation_layout = None
+SERVICE_ISOLATION_WAIT_SECONDS = 60
+DB_SYNC_STOP_TIMEOUT_SECONDS = 600
+# log tailers and metrics endpoints
+AUX_POLL_INTERVAL_SECONDS = 10
+# how much of the node / db-sync logs is printed after they are started (the logs are tailed, never read whole)
+STARTUP_LOG_TAIL_BYTES = 16 * 1024
+# sync_percent value at which the sync is considered complete
+DB_SYNC_PROGRESS_TARGET = 1
 
 
 def get_environment():
@@ -56,6 +81,7 @@ def get_db_sync_archive_url(db_pr):
     return f"https://hydra.iohk.io/job/Cardano/cardano-db-sync{cardano_db_sync_pr}/cardano-db-sync-linux/latest-finished/download/1/"
 
 
+@traced
 def get_and_extract_archive_files(archive_url):
     current_directory = os.getcwd()
     request = requests.get(archive_url, allow_redirects=True)
@@ -75,6 +101,7 @@ def get_and_extract_archive_files(archive_url):
     print(f" ------ listdir (after archive extraction): {os.listdir(current_directory)}")
 
 
+@traced
 def get_node_config_files(env):
     base_url = "https://hydra.iohk.io/job/Cardano/iohk-nix/cardano-deployment/latest-finished/download/1/"
     urllib.request.urlretrieve(base_url + env + "-config.json",env + "-config.json",)
@@ -106,6 +133,7 @@ def get_testnet_value():
         return None
 
 
+@traced
 def get_node_version():
     try:
         cmd = "./cardano-cli --version"
@@ -125,6 +153,7 @@ def get_node_version():
         )
 
 
+@traced
 def get_node_tip(timeout_seconds=10):
     current_directory = os.getcwd()
     os.chdir(ROOT_TEST_PATH / "cardano-node")
@@ -157,6 +186,7 @@ def get_node_tip(timeout_seconds=10):
     exit(1)
 
 
+@traced
 def wait_for_node_to_start():
     # when starting from clean state it might take ~30 secs for the cli to work
     # when starting from existing state it might take >10 mins for the cli to work (opening db and
@@ -170,6 +200,7 @@ def wait_for_node_to_start():
     return start_time_seconds
 
 
+@traced
 def start_node_in_cwd(env):
     current_directory = Path.cwd()
     if not 'cardano-node' == basename(normpath(current_directory)):
@@ -182,12 +213,14 @@ def start_node_in_cwd(env):
         f"--host-addr 0.0.0.0 --port 3000 --config "
         f"{env}-config.json --socket-path ./db/node.socket"
     )
+    cmd = get_numactl_prefix(isolation_layout, "cardano-node") + cmd
 
     logfile = open(NODE_LOG_FILE_PATH, "w+")
     print(f"start node cmd: {cmd}")
 
     try:
         p = subprocess.Popen(cmd.split(" "), stdout=logfile, stderr=logfile)
+        apply_service_isolation(isolation_layout, "cardano-node", wait_seconds=SERVICE_ISOLATION_WAIT_SECONDS)
         print("waiting for db folder to be created")
         count = 0
         count_timeout = 299
@@ -212,6 +245,7 @@ def start_node_in_cwd(env):
         )
 
 
+@traced
 def setup_postgres():
     current_directory = os.getcwd()
     os.chdir(ROOT_TEST_PATH)
@@ -220,13 +254,14 @@ def setup_postgres():
     export_env_var("PGPORT", '5432')
 
     try:
-        cmd = "./scripts/postgres-start.sh '/tmp/postgres' -k"
+        cmd = get_numactl_prefix(isolation_layout, "postgres") + "./scripts/postgres-start.sh '/tmp/postgres' -k"
         output = (
             subprocess.check_output(cmd, shell=True, stderr=subprocess.STDOUT)
             .decode("utf-8")
             .strip()
         )
         print(f"Setup postgres script output: {output}")
+        apply_service_isolation(isolation_layout, "postgres", wait_seconds=SERVICE_ISOLATION_WAIT_SECONDS)
         os.chdir(current_directory)
     except subprocess.CalledProcessError as e:
         raise RuntimeError(
@@ -236,6 +271,42 @@ def setup_postgres():
         )
 
 
+@traced
+def build_db_sync():
+    # the nix-build output of every built revision is kept (and registered as a nix GC root) in the
+    # cache dir so the same tag/commit is never built twice on the same agent
+    current_directory = os.getcwd()
+    os.chdir(ROOT_TEST_PATH / "cardano-db-sync")
+    git_rev = Repo(".").head.commit.hexsha
+    cached_build = get_cache_dir() / "db-sync-builds" / git_rev
+    cached_build.parent.mkdir(parents=True, exist_ok=True)
+
+    start_build = time.perf_counter()
+    cache_hit = cached_build.exists()
+    if cache_hit:
+        print(f"Reusing the cached db-sync build for revision {git_rev}: {os.readlink(cached_build)}")
+    else:
+        print(f"No cached db-sync build for revision {git_rev} - building it")
+        cmd = ["nix-build", "-A", "cardano-db-sync", "-o", str(cached_build)]
+        try:
+            subprocess.run(cmd, check=True)
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(
+                "command '{}' return with error (code {}): {}".format(
+                    e.cmd, e.returncode, " ".join(str(e.output).split())
+                )
+            )
+    if os.path.lexists("db-sync-node"):
+        os.remove("db-sync-node")
+    os.symlink(os.readlink(cached_build), "db-sync-node")
+    build_time_seconds = int(time.perf_counter() - start_build)
+    os.chdir(current_directory)
+
+    print(f" === db-sync build took {build_time_seconds} seconds (cache hit: {cache_hit})")
+    return git_rev, cache_hit, build_time_seconds
+
+
+@traced
 def start_db_sync():
     current_directory = os.getcwd()
     os.chdir(ROOT_TEST_PATH)
@@ -243,8 +314,8 @@ def start_db_sync():
     export_env_var("LOG_FILEPATH", DB_SYNC_LOG_FILE_PATH)
 
     try:
-        cmd = "./scripts/start_database.sh"
-        p = subprocess.Popen(cmd)
+        cmd = get_numactl_prefix(isolation_layout, "cardano-db-sync") + "./scripts/start_database.sh"
+        p = subprocess.Popen(cmd.split())
         os.chdir(current_directory)
     except subprocess.CalledProcessError as e:
         raise RuntimeError(
@@ -265,12 +336,14 @@ def start_db_sync():
             if "cardano-db-sync" in proc.name():
                 print(f"db-sync process present: {proc}")
                 not_found = False
+                apply_service_isolation(isolation_layout, "cardano-db-sync")
                 return
         print("Waiting for db-sync to start")
         counter += 3
         time.sleep(3)
 
 
+@traced
 def get_db_sync_version():
     try:
         cmd = "db-sync-node/bin/cardano-db-sync --version"
@@ -290,6 +363,7 @@ def get_db_sync_version():
         )
 
 
+@traced
 def get_db_sync_progress():
     p = subprocess.Popen(["psql", "-P", "pager=off", "-qt", "-U", "postgres", "-d", f"{get_environment()}",  "-c", "select 100 * (extract (epoch from (max (time) at time zone 'UTC')) - extract (epoch from (min (time) at time zone 'UTC'))) / (extract (epoch from (now () at time zone 'UTC')) - extract (epoch from (min (time) at time zone 'UTC'))) as sync_percent from block ;" ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     try:
@@ -304,7 +378,8 @@ def get_db_sync_progress():
         )
 
 
-def get_db_sync_tip():
+@traced
+def get_db_sync_tip(retries=11):
     isPostgresOn = True
     count = 0
     p = subprocess.Popen(["psql", "-P", "pager=off", "-qt", "-U", "postgres", "-d", f"{get_environment()}",  "-c", "select epoch_no, block_no from block order by id desc limit 1;" ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
@@ -315,7 +390,7 @@ def get_db_sync_tip():
             epoch_no, block_no = [e.strip() for e in outs.decode("utf-8").split("|")]
             return epoch_no, block_no
         except ValueError as e:
-            if count > 10:
+            if count >= retries:
                 isPostgresOn = False
                 raise
             time.sleep(60)
@@ -329,24 +404,126 @@ def get_db_sync_tip():
             )
 
 
+@traced
 def export_epoch_sync_times_from_db(file):
-    os.chdir(ROOT_TEST_PATH / "cardano-db-sync")
-    p = subprocess.Popen(["psql", f"{get_environment()}", "-t", "-c", f"\o {file}", "-c", "SELECT array_to_json(array_agg(epoch_sync_time), FALSE) FROM epoch_sync_time;" ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    conn = create_db_sync_connection(get_environment())
     try:
-        outs, errs = p.communicate(timeout=5)
-        print(outs.decode("utf-8"))
-        return outs.decode("utf-8")
-    except (TimeoutExpired, subprocess.CalledProcessError) as e:
-        p.kill()
-        raise RuntimeError(
-            "command '{}' return with error (code {}): {}".format(
-                e.cmd, e.returncode, " ".join(str(e.output).split())
-            )
-        )
+        return export_table(conn, "epoch_sync_time", ROOT_TEST_PATH / "cardano-db-sync" / file)
+    finally:
+        conn.close()
+
+
+def get_metrics_url(arg_name):
+    url = vars(args)[arg_name]
+    return None if url == "none" else url
+
+
+def get_tables_to_export():
+    tables = vars(args)["export_tables"]
+    return [t.strip() for t in tables.split(",") if t.strip()] if tables else []
+
+
+def add_tip_samples_to_run_archive(run_archive, node_tip, db_sync_tip):
+    node_epoch_no, node_block_no, _, node_slot_no, _, _ = node_tip
+    db_epoch_no, db_block_no = db_sync_tip
+    node_ram_bytes, node_cpu_percent = get_process_resources("cardano-node")
+    db_sync_ram_bytes, db_sync_cpu_percent = get_process_resources("cardano-db-sync")
+    run_archive.add_sample("node_tip", epoch_no=node_epoch_no, block_no=node_block_no, slot_no=node_slot_no,
+                           ram_bytes=node_ram_bytes, cpu_percent=node_cpu_percent)
+    run_archive.add_sample("db_sync_tip", epoch_no=int(db_epoch_no), block_no=int(db_block_no),
+                           ram_bytes=db_sync_ram_bytes, cpu_percent=db_sync_cpu_percent)
+
+
+@traced
+def add_epochs_and_eras_to_run_archive(run_archive):
+    conn = create_db_sync_connection(get_environment())
+    try:
+        epoch_sync_times = get_epoch_sync_times(conn)
+        era_stats = get_era_stats(conn)
+    finally:
+        conn.close()
+
+    epoch_durations = {}
+    for epoch_no, sync_duration_secs, state in epoch_sync_times:
+        epoch_durations[epoch_no] = sync_duration_secs
+        run_archive.add_epoch(epoch_no, sync_duration_secs, state)
+    for era, stats in era_stats.items():
+        era_sync_duration_secs = sum(v for k, v in epoch_durations.items()
+                                     if stats["start_epoch"] <= k <= stats["end_epoch"])
+        run_archive.add_era(era, sync_duration_secs=era_sync_duration_secs, **stats)
+    return list(era_stats.keys())
+
+
+@traced
+def get_epoch_sync_analysis():
+    conn = create_db_sync_connection(get_environment())
+    try:
+        epoch_sync_times = get_epoch_sync_times(conn)
+        epoch_block_stats = get_epoch_block_stats(conn)
+    finally:
+        conn.close()
+    return analyze_epoch_sync_times(epoch_sync_times, epoch_block_stats)
 
 
-def wait_for_db_to_sync():
+@traced
+def poll_log_tailers(log_tailers, run_archive=None):
+    for log_tailer in log_tailers:
+        log_tailer.poll(run_archive)
+
+
+def get_ledger_state_dir():
+    return ROOT_TEST_PATH / "cardano-db-sync" / "ledger-state" / get_environment()
+
+
+@traced
+def capture_snapshot_during_sync(snapshot_dir, epoch_no, block_no):
+    # db-sync has to exit on its own (SIGTERM) - a killed db-sync can leave a truncated ledger state file
+    # returns (pause, capture) seconds - the pause includes the db-sync stop and restart; capture is None when
+    # the snapshot was not captured
+    start_pause = time.perf_counter()
+    capture_time_seconds = None
+    if stop_process_gracefully('cardano-db-sync', timeout=DB_SYNC_STOP_TIMEOUT_SECONDS):
+        capture_time_seconds = capture_db_sync_snapshot(snapshot_dir, get_environment(), get_ledger_state_dir(),
+                                                        epoch_no, block_no)
+    else:
+        print(" !!! ERROR: db-sync had to be killed - the snapshot was not captured")
+    export_env_var("DB_SYNC_SKIP_CREATEDB", 1)
+    start_db_sync()
+    return int(time.perf_counter() - start_pause), capture_time_seconds
+
+
+def collect_stall_diagnostics(reason, node_tip=None, db_sync_tip=None):
+    diagnostics = OrderedDict()
+    diagnostics["reason"] = reason
+    diagnostics["time"] = get_current_date_time()
+    diagnostics["node_tip"] = node_tip
+    diagnostics["db_sync_tip"] = db_sync_tip
+    diagnostics["db_sync_process_running"] = is_process_running("cardano-db-sync")
+    diagnostics["node_process_running"] = is_process_running("cardano-node")
+    diagnostics["db_sync_log_tail"] = tail_file(DB_SYNC_LOG_FILE_PATH)
+    diagnostics["node_log_tail"] = tail_file(NODE_LOG_FILE_PATH)
+    return diagnostics
+
+
+def check_for_sync_stall(progress_model, now, start_sync, node_tip=None, db_sync_tip=None):
+    reason = None
+    if not is_process_running("cardano-db-sync"):
+        reason = "the cardano-db-sync process is not running"
+    elif progress_model.is_stalled(now):
+        reason = f"db-sync block_no did not advance for " \
+                 f"{int(progress_model.get_seconds_without_progress(now))} seconds"
+    if reason:
+        print(f"!!! ERROR: db-sync sync stalled - {reason}")
+        raise SyncStalledError(reason, int(now - start_sync),
+                               collect_stall_diagnostics(reason, node_tip, db_sync_tip))
+
+
+@traced
+def wait_for_db_to_sync(run_archive=None, log_tailers=(), metrics_scraper=None, snapshot_capture=None,
+                        stall_timeout_seconds=STALL_TIMEOUT_SECONDS):
     start_sync = time.perf_counter()
+    progress_model = SyncProgressModel(DB_SYNC_PROGRESS_TARGET, stall_timeout_seconds)
+    progress_model.reset_stall_timer(start_sync)
     isFloat = False
 
     while not isFloat:
@@ -355,24 +532,57 @@ def wait_for_db_to_sync():
             isFloat = True
         except ValueError:
             print("Progress count has not started, output missing or not a float number")
+            check_for_sync_stall(progress_model, time.perf_counter(), start_sync)
             time.sleep(5)
 
-    count = 0
-    while db_sync_progress < 1:
-        if count % 60 == 0:
-            get_node_tip()
+    # the tip probes are scheduled from the estimated time left (ETA) while the logs and the
+    # metrics endpoints are polled at a fixed interval; the loop only wakes up when something is due
+    next_tip_poll = next_aux_poll = time.perf_counter()
+    while db_sync_progress < DB_SYNC_PROGRESS_TARGET:
+        now = time.perf_counter()
+        if now >= next_tip_poll:
+            node_tip = get_node_tip()
             epoch_no, block_no = get_db_sync_tip()
+            if run_archive is not None:
+                add_tip_samples_to_run_archive(run_archive, node_tip, (epoch_no, block_no))
+            if snapshot_capture and "pause_time_in_sec" not in snapshot_capture \
+                    and int(epoch_no) >= snapshot_capture["epoch"]:
+                snapshot_capture["pause_time_in_sec"], snapshot_capture["capture_time_in_sec"] = \
+                    capture_snapshot_during_sync(snapshot_capture["dir"], epoch_no, block_no)
+                now = time.perf_counter()
+                progress_model.reset_stall_timer(now)
             db_sync_progress = float(get_db_sync_progress())
-            print(f"db sync progress : {db_sync_progress}, epoch: {epoch_no}, block: {block_no}")
-        time.sleep(1)
-        count += 1
+            progress_model.add_observation(now, int(block_no), db_sync_progress)
+            eta_seconds = progress_model.get_eta_seconds()
+            print(f"db sync progress : {db_sync_progress}, epoch: {epoch_no}, block: {block_no}, "
+                  f"ETA: {seconds_to_time(int(eta_seconds)) if eta_seconds is not None else 'unknown'}")
+            check_for_sync_stall(progress_model, now, start_sync, node_tip, (epoch_no, block_no))
+            next_tip_poll = now + progress_model.get_poll_interval()
+        if now >= next_aux_poll:
+            poll_log_tailers(log_tailers, run_archive)
+            if metrics_scraper is not None:
+                metrics_scraper.scrape(run_archive)
+            next_aux_poll = now + AUX_POLL_INTERVAL_SECONDS
+        time.sleep(max(0, min(next_tip_poll, next_aux_poll) - time.perf_counter()))
 
     end_sync = time.perf_counter()
     sync_time_seconds = int(end_sync - start_sync)
+    if snapshot_capture and "pause_time_in_sec" in snapshot_capture:
+        # db-sync was stopped while the snapshot was captured
+        sync_time_seconds -= snapshot_capture["pause_time_in_sec"]
     return sync_time_seconds
 
 
+def drop_page_cache_before_phase(phase):
+    if not vars(args)["drop_caches"]:
+        return None
+    dropped = drop_page_cache()
+    print(f"Page cache dropped before the {phase} phase: {dropped}")
+    return dropped
+
+
 def main():
+    global isolation_layout
 
     platform_system, platform_release, platform_version = get_os_type()
     print(f"Platform: {platform_system, platform_release, platform_version}")
@@ -389,6 +599,12 @@ def main():
     db_branch = get_db_sync_branch()
     print(f"DB sync branch: {db_branch}")
 
+    if vars(args)["isolate"]:
+        isolation_layout = build_isolation_layout()
+        print(f"Isolation layout: {isolation_layout}")
+        apply_service_isolation(isolation_layout, HARNESS_SERVICE_NAME)
+    page_cache_dropped = OrderedDict()
+
     # cardano-node setup
     NODE_DIR=create_dir('cardano-node')
     os.chdir(NODE_DIR)
@@ -396,22 +612,61 @@ def main():
     get_node_config_files(env)
     get_and_extract_archive_files(get_node_archive_url(node_pr))
     cli_version, cli_git_rev = get_node_version()
+    page_cache_dropped["node_start"] = drop_page_cache_before_phase("node start")
     start_node_in_cwd(env)
-    print_file(NODE_LOG_FILE_PATH)
+    print(tail_file(NODE_LOG_FILE_PATH, STARTUP_LOG_TAIL_BYTES))
 
     # cardano-db sync setup
     os.chdir(ROOT_TEST_PATH)
     setup_postgres()
-    DB_SYNC_DIR = clone_repo('cardano-db-sync', db_branch)
+    DB_SYNC_DIR = checkout_repo_from_mirror('cardano-db-sync', db_branch, vars(args)["db_sync_repo_url"])
     os.chdir(DB_SYNC_DIR)
     sync_test_start_time = get_current_date_time()
+    run_id = f"{env}_{datetime.now().strftime('%Y%m%dT%H%M%S')}"
+    # outside of the db-sync checkout (deleted by the next run) so the archived runs can be compared
+    run_archive_dir = vars(args)["run_archive_dir"] or get_cache_dir() / RUN_ARCHIVE_DIR_NAME
+    run_archive = RunArchiveWriter(run_archive_dir, run_id)
+    db_sync_build_rev, db_sync_build_cache_hit, db_sync_build_time_in_secs = build_db_sync()
+    snapshot_restore_time_in_secs = None
+    if vars(args)["restore_snapshot_dir"]:
+        snapshot_restore_time_in_secs = restore_db_sync_snapshot(
+            vars(args)["restore_snapshot_dir"], env, get_ledger_state_dir())
+        # the database was created by pg_restore
+        export_env_var("DB_SYNC_SKIP_CREATEDB", 1)
+    snapshot_capture = None
+    if vars(args)["capture_snapshot_epoch"] is not None:
+        snapshot_capture = {"epoch": int(vars(args)["capture_snapshot_epoch"]),
+                            "dir": vars(args)["capture_snapshot_dir"] or
+                            ROOT_TEST_PATH / f"db-sync-snapshot-{env}-{vars(args)['capture_snapshot_epoch']}"}
+    page_cache_dropped["db_sync_sync"] = drop_page_cache_before_phase("db-sync sync")
     start_db_sync()
     db_sync_version, db_sync_git_rev = get_db_sync_version()
     print(f"- cardano-db-sync version: {db_sync_version}")
     print(f"- cardano-db-sync git revision: {db_sync_git_rev}")
-    print_file(DB_SYNC_LOG_FILE_PATH)
-    db_full_sync_time_in_secs = wait_for_db_to_sync()
-    epoch_no, block_no = get_db_sync_tip()
+    print(tail_file(DB_SYNC_LOG_FILE_PATH, STARTUP_LOG_TAIL_BYTES))
+    log_tailers = [LogTailer(NODE_LOG_FILE_PATH, "node_log"), LogTailer(DB_SYNC_LOG_FILE_PATH, "db_sync_log")]
+    metrics_scraper = MetricsScraper({"node_metrics": get_metrics_url("node_metrics_url"),
+                                      "db_sync_metrics": get_metrics_url("db_sync_metrics_url")})
+    sync_status = "synced"
+    stall_reason = None
+    try:
+        db_full_sync_time_in_secs = wait_for_db_to_sync(run_archive, log_tailers, metrics_scraper, snapshot_capture,
+                                                        int(vars(args)["stall_timeout_minutes"]) * 60)
+    except SyncStalledError as e:
+        # abort early and still produce a (partial) result
+        sync_status = "stalled"
+        stall_reason = e.reason
+        db_full_sync_time_in_secs = e.elapsed_seconds
+        with open(STALL_DIAGNOSTICS_FILE_NAME, 'w') as diagnostics_file:
+            json.dump(e.diagnostics, diagnostics_file, indent=2)
+    # after a stall db-sync may have died before its schema migrations or its first block - the tip is
+    # probed once (no retries) and the db-sync tables are only read when they exist
+    db_sync_tables_exist = sync_status == "synced" or has_tables(env, DB_SYNC_TABLES_READ_AFTER_SYNC)
+    try:
+        epoch_no, block_no = get_db_sync_tip(retries=0 if sync_status == "stalled" else 11)
+    except ValueError:
+        # stalled before inserting the first block
+        epoch_no, block_no = None, None
     end_test_time = get_current_date_time()
     print(f"FINAL db-sync progress: {get_db_sync_progress()}, epoch: {epoch_no}, block: {block_no}")
     print(f"TOTAL sync time [sec]: {db_full_sync_time_in_secs}")
@@ -421,6 +676,12 @@ def main():
     stop_process('cardano-db-sync')
     stop_process('cardano-node')
 
+    poll_log_tailers(log_tailers, run_archive)
+    for log_tailer in log_tailers:
+        log_tailer.close()
+    metrics_scraper.close()
+    eras_in_test = add_epochs_and_eras_to_run_archive(run_archive) if db_sync_tables_exist else []
+
     # export test data as a json file
     test_data = OrderedDict()
     test_data["platform_system"] = platform_system
@@ -437,30 +698,65 @@ def main():
     test_data["db_sync_git_rev"] = db_sync_git_rev
     test_data["start_test_time"] = start_test_time
     test_data["end_test_time"] = end_test_time
+    test_data["db_sync_build_rev"] = db_sync_build_rev
+    test_data["db_sync_build_cache_hit"] = db_sync_build_cache_hit
+    test_data["db_sync_build_time_in_sec"] = db_sync_build_time_in_secs
+    test_data["restored_snapshot_dir"] = vars(args)["restore_snapshot_dir"]
+    test_data["snapshot_restore_time_in_sec"] = snapshot_restore_time_in_secs
+    test_data["snapshot_capture_time_in_sec"] = (snapshot_capture or {}).get("capture_time_in_sec")
+    test_data["snapshot_pause_time_in_sec"] = (snapshot_capture or {}).get("pause_time_in_sec")
+    test_data["snapshot_captured"] = (snapshot_capture or {}).get("capture_time_in_sec") is not None
+    test_data["isolation_layout"] = isolation_layout
+    test_data["isolated_processes"] = dict(isolated_processes_per_service)
+    test_data["page_cache_dropped"] = page_cache_dropped
+    test_data["sync_status"] = sync_status
+    test_data["stall_reason"] = stall_reason
     test_data["total_sync_time_in_sec"] = db_full_sync_time_in_secs
     test_data["total_sync_time_in_h_m_s"] = seconds_to_time(int(db_full_sync_time_in_secs))
     test_data["last_synced_epoch_no"] = epoch_no
     test_data["last_synced_block_no"] = block_no
+    test_data["eras_in_test"] = eras_in_test
+    test_data["run_id"] = run_id
+    test_data["log_events"] = {t.source: dict(t.events_count) for t in log_tailers}
+    test_data["metrics_scrapes"] = metrics_scraper.scrapes_count
+    test_data["epoch_sync_analysis"] = get_epoch_sync_analysis() if db_sync_tables_exist else None
+
+    if db_sync_tables_exist:
+        export_epoch_sync_times_from_db(EPOCH_SYNC_TIMES_FILE_NAME)
+        tables_to_export = get_tables_to_export()
+        if tables_to_export:
+            export_tables(env, tables_to_export, ROOT_TEST_PATH / "cardano-db-sync", vars(args)["export_format"])
+    else:
+        print(f" !!! WARNING: the db-sync tables {DB_SYNC_TABLES_READ_AFTER_SYNC} do not exist - nothing to export")
+
+    # the results are written before the artifacts are uploaded (and rewritten with the artifacts info after)
+    test_data["phase_durations_in_sec"] = get_phase_durations()
     with open(TEST_RESULTS_FILE_NAME, 'w') as test_results_file:
         json.dump(test_data, test_results_file, indent=2)
-
-    export_epoch_sync_times_from_db(EPOCH_SYNC_TIMES_FILE_NAME)
+    run_archive.close(summary=test_data)
+
+    # compress and upload artifacts (the epoch sync times dump is already zstd compressed)
+    uploader = get_uploader(vars(args)["artifacts_uploader"], vars(args)["artifacts_dir"])
+    part_size_mb = int(vars(args)["artifact_part_size_mb"])
+    test_data["artifacts"] = pack_and_upload_artifacts(
+        [NODE_LOG_FILE_PATH, DB_SYNC_LOG_FILE_PATH], uploader, part_size=part_size_mb * 1024 * 1024 or None)
+    if uploader is not None:
+        files_to_upload = [EPOCH_SYNC_TIMES_FILE_PATH] if db_sync_tables_exist else []
+        files_to_upload.extend(get_run_files(run_archive_dir, run_id))
+        if sync_status == "stalled":
+            files_to_upload.append(STALL_DIAGNOSTICS_FILE_NAME)
+        test_data["artifacts_upload_errors"] = upload_files(uploader, files_to_upload)
+
+    test_data["phase_durations_in_sec"] = get_phase_durations()
+    with open(TEST_RESULTS_FILE_NAME, 'w') as test_results_file:
+        json.dump(test_data, test_results_file, indent=2)
+    write_chrome_trace(TRACE_FILE_NAME)
 
     print_file(TEST_RESULTS_FILE_NAME)
 
-    # compress artifacts
-    NODE_ARCHIVE = 'cardano_node.zip'
-    DB_SYNC_ARCHIVE = 'cardano_db_sync.zip'
-    SYNC_DATA_ARCHIVE = 'epoch_sync_times_dump.zip'
-
-    #zip_file(NODE_ARCHIVE, NODE_LOG_FILE_PATH)
-    #zip_file(DB_SYNC_ARCHIVE, DB_SYNC_LOG_FILE_PATH)
-    #zip_file(SYNC_DATA_ARCHIVE, EPOCH_SYNC_TIMES_FILE_PATH)
-
-    # upload artifacts
-    #upload_artifact(NODE_ARCHIVE)
-    #upload_artifact(DB_SYNC_ARCHIVE)
-    #upload_artifact(SYNC_DATA_ARCHIVE)
+    if sync_status != "synced":
+        print(f"!!! ERROR: the sync did not complete: {stall_reason}")
+        exit(1)
 
 
 if __name__ == "__main__":
@@ -472,11 +768,67 @@ if __name__ == "__main__":
     parser.add_argument(
         "-dbr", "--db_sync_branch", help="db-sync branch"
     )
+    parser.add_argument(
+        "-dbu", "--db_sync_repo_url",
+        help="upstream of the local cardano-db-sync git mirror (default: the GitHub repository)"
+    )
     parser.add_argument(
         "-e",
         "--environment",
         help="the environment on which to run the tests - shelley_qa, testnet, staging or mainnet.",
     )
+    parser.add_argument(
+        "-ext", "--export_tables", help="comma separated list of db-sync tables to export after the sync (ex: block,tx)"
+    )
+    parser.add_argument(
+        "-exf", "--export_format", default="parquet", choices=["parquet", "ndjson.zst"],
+        help="file format used for the exported db-sync tables"
+    )
+    parser.add_argument(
+        "-rsd", "--restore_snapshot_dir",
+        help="warm start: restore this db-sync snapshot (pg_dump directory + ledger-state) before starting db-sync"
+    )
+    parser.add_argument(
+        "-cse", "--capture_snapshot_epoch",
+        help="capture a db-sync snapshot (pg_dump directory + ledger-state) once db-sync reaches this epoch"
+    )
+    parser.add_argument(
+        "-csd", "--capture_snapshot_dir", help="where to write the captured db-sync snapshot"
+    )
+    parser.add_argument(
+        "-iso", "--isolate", action="store_true",
+        help="pin node, db-sync, postgres and the harness to separate cpu sets / NUMA nodes and set their io priority"
+    )
+    parser.add_argument(
+        "-dc", "--drop_caches", action="store_true", help="drop the page cache before the node start and the sync"
+    )
+    parser.add_argument(
+        "-stm", "--stall_timeout_minutes", default=STALL_TIMEOUT_SECONDS // 60,
+        help="abort the test when the db-sync block_no does not advance for this many minutes"
+    )
+    parser.add_argument(
+        "-nmu", "--node_metrics_url", default=NODE_METRICS_URL,
+        help="cardano-node Prometheus endpoint ('none' to disable the scraping)"
+    )
+    parser.add_argument(
+        "-dmu", "--db_sync_metrics_url", default=DB_SYNC_METRICS_URL,
+        help="cardano-db-sync Prometheus endpoint ('none' to disable the scraping)"
+    )
+    parser.add_argument(
+        "-upl", "--artifacts_uploader", default="buildkite", choices=["buildkite", "local", "none"],
+        help="where to upload the compressed logs and the epoch sync times dump"
+    )
+    parser.add_argument(
+        "-ard", "--artifacts_dir", help="destination directory used by the 'local' artifacts uploader"
+    )
+    parser.add_argument(
+        "-rad", "--run_archive_dir",
+        help="directory of the per run archives (default: run_archive in the DB_SYNC_TESTS_CACHE_DIR cache)"
+    )
+    parser.add_argument(
+        "-aps", "--artifact_part_size_mb", default=1024,
+        help="split the compressed artifacts in parts of this size (MB); 0 means no split"
+    )
 
     args = parser.parse_args()
 
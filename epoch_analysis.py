@@ -0,0 +1,114 @@
+from collections import OrderedDict
+
+import numpy as np
+
+
+ROLLING_WINDOW_EPOCHS = 5
+OUTLIER_Z_SCORE = 3.0
+MAX_REPORTED_OUTLIERS = 10
+
+
+def get_z_scores(values):
+    std = values.std()
+    if not std:
+        return np.zeros_like(values)
+    return (values - values.mean()) / std
+
+
+def get_rolling_median(values, window=ROLLING_WINDOW_EPOCHS):
+    # centered rolling median; the edges use the nearest complete window
+    if len(values) < window:
+        return np.full_like(values, np.median(values))
+    medians = np.median(np.lib.stride_tricks.sliding_window_view(values, window), axis=1)
+    half_window = window // 2
+    return np.concatenate([np.full(half_window, medians[0]), medians,
+                           np.full(len(values) - len(medians) - half_window, medians[-1])])
+
+
+def safe_divide(numerator, denominator):
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator, dtype=float), where=denominator > 0)
+
+
+def get_percentiles(values):
+    return OrderedDict((f"p{p}", round(float(v), 2)) for p, v in zip((10, 50, 90), np.percentile(values, [10, 50, 90])))
+
+
+def get_outlier_cause(seconds_z, residual_z, load_z, z_score_threshold):
+    # slow_for_its_load / fast_for_its_load: not explained by the load fit; heavy_epoch: explained by a large load;
+    # slow / fast: explained by the load fit, without the epoch being an outlier by size
+    if residual_z > z_score_threshold:
+        return "slow_for_its_load"
+    if residual_z < -z_score_threshold:
+        return "fast_for_its_load"
+    if load_z > z_score_threshold:
+        return "heavy_epoch"
+    return "slow" if seconds_z > 0 else "fast"
+
+
+def analyze_epoch_sync_times(epoch_sync_times, epoch_block_stats, z_score_threshold=OUTLIER_Z_SCORE):
+    # epoch_sync_times: (epoch_no, seconds, state) rows; epoch_block_stats: (epoch_no, blocks, txs, bytes) rows
+    if not epoch_sync_times or not epoch_block_stats:
+        return None
+    sync_epochs = np.array([row[0] for row in epoch_sync_times], dtype=np.int64)
+    sync_seconds = np.array([row[1] for row in epoch_sync_times], dtype=float)
+    stats = np.array(epoch_block_stats, dtype=float)
+    _, sync_idx, stats_idx = np.intersect1d(sync_epochs, stats[:, 0].astype(np.int64), return_indices=True)
+    if len(sync_idx) < 2:
+        return None
+
+    epochs = sync_epochs[sync_idx]
+    seconds = sync_seconds[sync_idx]
+    blocks, txs, size_bytes = stats[stats_idx, 1], stats[stats_idx, 2], stats[stats_idx, 3]
+    tx_per_sec = safe_divide(txs, seconds)
+    bytes_per_sec = safe_divide(size_bytes, seconds)
+    blocks_per_sec = safe_divide(blocks, seconds)
+
+    # sync time explained by the epoch load (least squares fit on blocks, txs and bytes) - the residual
+    # z-scores point to epochs that are slow for their size, the load z-scores to the heavy epochs
+    load = np.column_stack([np.ones_like(seconds), blocks, txs, size_bytes])
+    coefficients, _, _, _ = np.linalg.lstsq(load, seconds, rcond=None)
+    residuals = seconds - load @ coefficients
+    total_variance = ((seconds - seconds.mean()) ** 2).sum()
+    r_squared = 1 - (residuals ** 2).sum() / total_variance if total_variance else None
+
+    seconds_z = get_z_scores(seconds)
+    residual_z = get_z_scores(residuals)
+    load_z = get_z_scores(size_bytes)
+    seconds_rolling_median = get_rolling_median(seconds)
+
+    # outliers: epochs with an unusual sync time, in absolute terms or relative to their load
+    outlier_score = np.maximum(np.abs(seconds_z), np.abs(residual_z))
+    outliers = []
+    for i in np.argsort(-outlier_score):
+        if outlier_score[i] <= z_score_threshold or len(outliers) >= MAX_REPORTED_OUTLIERS:
+            break
+        outliers.append(OrderedDict([
+            ("epoch_no", int(epochs[i])),
+            ("sync_seconds", round(float(seconds[i]), 2)),
+            ("rolling_median_seconds", round(float(seconds_rolling_median[i]), 2)),
+            ("z_score", round(float(seconds_z[i]), 2)),
+            ("residual_z_score", round(float(residual_z[i]), 2)),
+            ("tx_count", int(txs[i])),
+            ("size_bytes", int(size_bytes[i])),
+            ("tx_per_sec", round(float(tx_per_sec[i]), 2)),
+            ("cause", get_outlier_cause(seconds_z[i], residual_z[i], load_z[i], z_score_threshold)),
+        ]))
+
+    # share of the sync time spent in the 10% heaviest epochs
+    heaviest_epochs = np.argsort(-size_bytes)[:max(1, len(size_bytes) // 10)]
+
+    summary = OrderedDict()
+    summary["epochs_analyzed"] = int(len(epochs))
+    summary["total_sync_seconds"] = round(float(seconds.sum()), 2)
+    summary["sync_seconds_per_epoch"] = get_percentiles(seconds)
+    summary["tx_per_sec"] = get_percentiles(tx_per_sec)
+    summary["bytes_per_sec"] = get_percentiles(bytes_per_sec)
+    summary["blocks_per_sec"] = get_percentiles(blocks_per_sec)
+    summary["overall_tx_per_sec"] = round(float(txs.sum() / seconds.sum()), 2) if seconds.sum() else None
+    summary["overall_bytes_per_sec"] = round(float(size_bytes.sum() / seconds.sum()), 2) if seconds.sum() else None
+    summary["load_explained_variance_r2"] = round(float(r_squared), 3) if r_squared is not None else None
+    summary["heaviest_10pct_epochs_sync_time_share"] = round(float(seconds[heaviest_epochs].sum() / seconds.sum()), 3) \
+        if seconds.sum() else None
+    summary["outlier_z_score_threshold"] = z_score_threshold
+    summary["outlier_epochs"] = outliers
+    return summary
@@ -0,0 +1,229 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import tempfile
+import time
+from collections import Counter, OrderedDict
+from pathlib import Path
+
+import db_sync_tests
+from log_tailer import LogTailer
+from metrics_scraper import MetricsScraper
+from utils import export_env_var, is_process_running, seconds_to_time
+
+
+ROOT_PATH = Path(__file__).resolve().parent
+SIMULATION_BIN_PATH = ROOT_PATH / "simulation" / "bin"
+SIMULATION_DB_NAME = "simulation"
+SIMULATION_TESTNET_MAGIC = 42
+BENCHMARK_RESULTS_FILE_NAME = 'harness_benchmark_results.json'
+
+# the probes of db_sync_tests.py that are counted as query load of the monitoring loop
+COUNTED_PROBES = ["get_node_tip", "get_db_sync_tip", "get_db_sync_progress"]
+# shorter simulated syncs mostly measure the startup polling, not the monitoring loop
+MIN_SIMULATED_SYNC_HOURS = 1
+
+
+class WarpedTime:
+    # replaces the `time` module inside db_sync_tests.py - every simulated second lasts 1/speedup real seconds
+    def __init__(self, speedup):
+        self.speedup = speedup
+        self.real_start = time.perf_counter()
+        self.sleeps_count = 0
+
+    def sleep(self, seconds):
+        self.sleeps_count += 1
+        time.sleep(seconds / self.speedup)
+
+    def perf_counter(self):
+        return self.real_start + (time.perf_counter() - self.real_start) * self.speedup
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+def count_calls(function, counter, name):
+    def counted(*args, **kwargs):
+        counter[name] += 1
+        return function(*args, **kwargs)
+    return counted
+
+
+def setup_workspace(workspace):
+    node_dir = workspace / "cardano-node"
+    node_dir.mkdir(parents=True)
+    (node_dir / "cardano-cli").symlink_to(SIMULATION_BIN_PATH / "cardano-cli")
+    (workspace / "cardano-db-sync").mkdir()
+    return workspace / "cardano-db-sync" / "db_sync_logfile.log"
+
+
+def start_postgres():
+    cmd = "./scripts/postgres-start.sh '/tmp/postgres-simulation' -k"
+    output = subprocess.check_output(cmd, shell=True, stderr=subprocess.STDOUT, cwd=ROOT_PATH).decode("utf-8")
+    print(f"Setup postgres script output: {output.strip()}")
+
+
+def wait_for_process(proc_name, popen, timeout_seconds=30):
+    start_wait = time.perf_counter()
+    while not is_process_running(proc_name):
+        if popen.poll() is not None:
+            raise RuntimeError(f"the simulated {proc_name} exited with code {popen.returncode}")
+        if time.perf_counter() - start_wait > timeout_seconds:
+            raise RuntimeError(f"no {proc_name} process found after {timeout_seconds} seconds")
+        time.sleep(0.1)
+
+
+def get_cpu_seconds(rusage):
+    return rusage.ru_utime + rusage.ru_stime
+
+
+def run_benchmark(speedup, chain_blocks, blocks_per_second, epoch_blocks, metrics_port=None):
+    workspace = Path(tempfile.mkdtemp(prefix="harness_benchmark_"))
+    log_file_path = setup_workspace(workspace)
+    print(f"Simulation workspace: {workspace}")
+
+    export_env_var("SIM_SPEEDUP", speedup)
+    export_env_var("SIM_START_TIME", time.time())
+    export_env_var("SIM_CHAIN_BLOCKS", chain_blocks)
+    export_env_var("SIM_BLOCKS_PER_SECOND", blocks_per_second)
+    export_env_var("SIM_EPOCH_BLOCKS", epoch_blocks)
+    export_env_var("SIM_DB_NAME", SIMULATION_DB_NAME)
+    export_env_var("SIM_TESTNET_MAGIC", SIMULATION_TESTNET_MAGIC)
+    export_env_var("LOG_FILEPATH", log_file_path)
+    if metrics_port:
+        export_env_var("SIM_METRICS_PORT", metrics_port)
+    db_sync = subprocess.Popen([str(SIMULATION_BIN_PATH / "cardano-db-sync")])
+    # like start_db_sync(): the monitoring loop starts once the db-sync process is found by its name
+    wait_for_process("cardano-db-sync", db_sync)
+
+    warped_time = WarpedTime(speedup)
+    probe_calls = Counter()
+    db_sync_tests.args = argparse.Namespace(environment=SIMULATION_DB_NAME)
+    db_sync_tests.ROOT_TEST_PATH = workspace
+    db_sync_tests.time = warped_time
+    db_sync_tests.get_testnet_value = lambda: f"--testnet-magic {SIMULATION_TESTNET_MAGIC}"
+    for probe in COUNTED_PROBES:
+        setattr(db_sync_tests, probe, count_calls(getattr(db_sync_tests, probe), probe_calls, probe))
+
+    log_tailers = [LogTailer(log_file_path, "db_sync_log")]
+    metrics_scraper = MetricsScraper(
+        {"db_sync_metrics": f"http://127.0.0.1:{metrics_port}/metrics" if metrics_port else None})
+
+    self_usage_start = resource.getrusage(resource.RUSAGE_SELF)
+    children_usage_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+    real_start = time.perf_counter()
+    try:
+        simulated_sync_time = db_sync_tests.wait_for_db_to_sync(None, log_tailers, metrics_scraper)
+    finally:
+        real_elapsed = time.perf_counter() - real_start
+        self_usage_end = resource.getrusage(resource.RUSAGE_SELF)
+        # psql and cardano-cli children only (db-sync is still running so it is not accounted yet)
+        children_usage_end = resource.getrusage(resource.RUSAGE_CHILDREN)
+        db_sync.terminate()
+        db_sync.wait()
+        metrics_scraper.close()
+        for log_tailer in log_tailers:
+            log_tailer.close()
+
+    simulated_hours = real_elapsed * speedup / 3600
+    results = OrderedDict()
+    results["speedup"] = speedup
+    results["chain_blocks"] = chain_blocks
+    results["blocks_per_second"] = blocks_per_second
+    results["real_time_in_sec"] = round(real_elapsed, 2)
+    results["simulated_sync_time_in_h_m_s"] = seconds_to_time(int(simulated_sync_time))
+    results["simulated_sync_time_in_sec"] = int(simulated_sync_time)
+    results["simulated_hours"] = round(simulated_hours, 3)
+    results["tip_probes"] = probe_calls["get_db_sync_tip"]
+    per_hour = OrderedDict()
+    per_hour["harness_cpu_sec"] = get_cpu_seconds(self_usage_end) - get_cpu_seconds(self_usage_start)
+    per_hour["probe_processes_cpu_sec"] = \
+        get_cpu_seconds(children_usage_end) - get_cpu_seconds(children_usage_start)
+    per_hour["sleep_wakeups"] = warped_time.sleeps_count
+    per_hour["voluntary_context_switches"] = self_usage_end.ru_nvcsw - self_usage_start.ru_nvcsw
+    per_hour["metrics_scrapes"] = metrics_scraper.scrapes_count
+    for probe in COUNTED_PROBES:
+        per_hour[f"{probe}_calls"] = probe_calls[probe]
+    per_hour["queries"] = sum(probe_calls.values())
+    results["per_simulated_hour"] = OrderedDict(
+        (name, round(value / simulated_hours, 3) if simulated_hours else None) for name, value in per_hour.items())
+    return results
+
+
+def check_simulated_sync(results, min_simulated_sync_hours):
+    errors = []
+    if results["simulated_sync_time_in_sec"] < min_simulated_sync_hours * 3600:
+        errors.append(f"the simulated sync took {results['simulated_sync_time_in_h_m_s']} - less than "
+                      f"{min_simulated_sync_hours} simulated hours (increase --chain_blocks)")
+    if not results["tip_probes"]:
+        errors.append("the monitoring loop made no tip probes")
+    return errors
+
+
+def compare_with_baseline(results, baseline_file, tolerance):
+    with open(baseline_file, "r") as json_file:
+        baseline = json.load(json_file)["per_simulated_hour"]
+    regressions = []
+    for name, value in results["per_simulated_hour"].items():
+        baseline_value = baseline.get(name)
+        if value is None or not baseline_value:
+            continue
+        if value > baseline_value * (1 + tolerance):
+            regressions.append(f"{name}: {value} (baseline: {baseline_value})")
+    return regressions
+
+
+def main():
+    if vars(args)["start_postgres"]:
+        start_postgres()
+    export_env_var("PGHOST", os.environ.get("PGHOST", 'localhost'))
+    export_env_var("PGUSER", os.environ.get("PGUSER", 'postgres'))
+    export_env_var("PGPORT", os.environ.get("PGPORT", '5432'))
+
+    results = run_benchmark(float(vars(args)["speedup"]), int(vars(args)["chain_blocks"]),
+                            float(vars(args)["blocks_per_second"]), int(vars(args)["epoch_blocks"]),
+                            vars(args)["metrics_port"])
+    print(json.dumps(results, indent=2))
+    with open(ROOT_PATH / vars(args)["output"], 'w') as results_file:
+        json.dump(results, results_file, indent=2)
+
+    errors = check_simulated_sync(results, float(vars(args)["min_simulated_sync_hours"]))
+    if errors:
+        print("!!! ERROR: the benchmark did not measure the monitoring loop:")
+        for error in errors:
+            print(f"  -- {error}")
+        exit(1)
+
+    if vars(args)["baseline"]:
+        regressions = compare_with_baseline(results, vars(args)["baseline"], float(vars(args)["tolerance"]))
+        if regressions:
+            print(f"!!! ERROR: harness overhead regressions (tolerance {vars(args)['tolerance']}):")
+            for regression in regressions:
+                print(f"  -- {regression}")
+            exit(1)
+        print("No harness overhead regressions compared to the baseline")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the overhead of the sync monitoring loop against simulated node/db-sync processes\n\n")
+
+    parser.add_argument("-s", "--speedup", default=600, help="simulated seconds per real second")
+    parser.add_argument("-cb", "--chain_blocks", default=200000, help="number of blocks of the simulated chain")
+    parser.add_argument("-bps", "--blocks_per_second", default=20,
+                        help="db-sync insert rate, in blocks per simulated second")
+    parser.add_argument("-eb", "--epoch_blocks", default=1000, help="number of blocks per simulated epoch")
+    parser.add_argument("-ms", "--min_simulated_sync_hours", default=MIN_SIMULATED_SYNC_HOURS,
+                        help="fail when the simulated sync is shorter than this")
+    parser.add_argument("-mp", "--metrics_port", help="serve Prometheus metrics from the simulated db-sync")
+    parser.add_argument("-sp", "--start_postgres", action="store_true",
+                        help="start a local postgres with scripts/postgres-start.sh")
+    parser.add_argument("-o", "--output", default=BENCHMARK_RESULTS_FILE_NAME, help="results file")
+    parser.add_argument("-b", "--baseline", help="results file of a previous run to compare with")
+    parser.add_argument("-t", "--tolerance", default=0.2, help="allowed relative increase compared to the baseline")
+
+    args = parser.parse_args()
+
+    main()
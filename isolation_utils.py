@@ -0,0 +1,155 @@
+import glob
+import os
+import re
+import shutil
+import subprocess
+import time
+from collections import OrderedDict
+
+import psutil
+from psutil import process_iter
+
+
+# share of the available cpus given to every service (the harness gets what is left, at least 1 cpu)
+SERVICE_CPU_SHARES = OrderedDict([
+    ("cardano-node", 0.35),
+    ("cardano-db-sync", 0.25),
+    ("postgres", 0.30),
+])
+HARNESS_SERVICE_NAME = "harness"
+# service -> number of processes isolated by apply_service_isolation()
+isolated_processes_per_service = OrderedDict()
+ISOLATION_WAIT_INTERVAL_SECONDS = 1
+# best effort class, 0 = highest priority; the harness itself gets the lowest one
+SERVICE_IO_PRIORITIES = {
+    "cardano-node": 0,
+    "cardano-db-sync": 0,
+    "postgres": 0,
+    HARNESS_SERVICE_NAME: 7,
+}
+
+
+def parse_cpu_list(cpu_list):
+    # "0-3,8,10-11" -> [0, 1, 2, 3, 8, 10, 11]
+    cpus = []
+    for cpu_range in cpu_list.strip().split(","):
+        if not cpu_range:
+            continue
+        if "-" in cpu_range:
+            first, last = cpu_range.split("-")
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(cpu_range))
+    return cpus
+
+
+def get_numa_nodes():
+    available_cpus = os.sched_getaffinity(0)
+    numa_nodes = OrderedDict()
+    for node_path in sorted(glob.glob("/sys/devices/system/node/node[0-9]*"),
+                            key=lambda p: int(re.search(r"(\d+)$", p).group(1))):
+        with open(os.path.join(node_path, "cpulist")) as cpulist_file:
+            cpus = [cpu for cpu in parse_cpu_list(cpulist_file.read()) if cpu in available_cpus]
+        if cpus:
+            numa_nodes[int(re.search(r"(\d+)$", node_path).group(1))] = cpus
+    if not numa_nodes:
+        numa_nodes[0] = sorted(available_cpus)
+    return numa_nodes
+
+
+def build_isolation_layout():
+    numa_nodes = get_numa_nodes()
+    # cpus ordered by NUMA node, so that the contiguous slices stay inside a node whenever possible
+    cpus = [(node, cpu) for node, node_cpus in numa_nodes.items() for cpu in node_cpus]
+    if len(cpus) < len(SERVICE_CPU_SHARES) + 1:
+        print(f" !!! WARNING: only {len(cpus)} cpus available - the services can not be isolated")
+        return None
+
+    layout = OrderedDict()
+    first_cpu = 0
+    for service, share in SERVICE_CPU_SHARES.items():
+        cpus_no = max(1, int(len(cpus) * share))
+        service_cpus = cpus[first_cpu:first_cpu + cpus_no]
+        layout[service] = {"cpus": [cpu for _, cpu in service_cpus],
+                           "numa_nodes": sorted({node for node, _ in service_cpus}),
+                           "io_priority": SERVICE_IO_PRIORITIES[service]}
+        first_cpu += cpus_no
+    harness_cpus = cpus[first_cpu:] or cpus[-1:]
+    layout[HARNESS_SERVICE_NAME] = {"cpus": [cpu for _, cpu in harness_cpus],
+                                    "numa_nodes": sorted({node for node, _ in harness_cpus}),
+                                    "io_priority": SERVICE_IO_PRIORITIES[HARNESS_SERVICE_NAME]}
+    return layout
+
+
+def get_numactl_prefix(layout, service):
+    # memory binding can only be set when a process is started (cpu affinity can be set at any time)
+    if not layout or service not in layout or not shutil.which("numactl"):
+        return ""
+    numa_nodes = ",".join(str(node) for node in layout[service]["numa_nodes"])
+    return f"numactl --cpunodebind={numa_nodes} --membind={numa_nodes} "
+
+
+def isolate_process(proc, cpus, io_priority):
+    procs = [proc] + proc.children(recursive=True)
+    for p in procs:
+        try:
+            p.cpu_affinity(cpus)
+            p.ionice(psutil.IOPRIO_CLASS_BE, io_priority)
+        except (psutil.NoSuchProcess, psutil.AccessDenied) as e:
+            print(f" !!! WARNING: could not isolate process {p}: {e}")
+    return len(procs)
+
+
+def isolate_service_processes(service, cpus, io_priority):
+    isolated_processes_no = 0
+    for proc in process_iter():
+        try:
+            if service not in proc.name():
+                continue
+        except psutil.NoSuchProcess:
+            continue
+        # processes started later by the service (ex: postgres backends) inherit the cpu affinity
+        isolated_processes_no += isolate_process(proc, cpus, io_priority)
+    return isolated_processes_no
+
+
+def apply_service_isolation(layout, service, wait_seconds=0):
+    # wait_seconds: how long to wait for the service process to show up (ex: while numactl is still
+    # exec-ing the service binary, the process is named numactl)
+    if not layout or service not in layout:
+        return 0
+    cpus = layout[service]["cpus"]
+    io_priority = layout[service]["io_priority"]
+    if service == HARNESS_SERVICE_NAME:
+        isolated_processes_no = isolate_process(psutil.Process(os.getpid()), cpus, io_priority)
+        isolated_processes_per_service[service] = isolated_processes_no
+        return isolated_processes_no
+
+    waited_seconds = 0
+    isolated_processes_no = isolate_service_processes(service, cpus, io_priority)
+    while not isolated_processes_no and waited_seconds < wait_seconds:
+        time.sleep(ISOLATION_WAIT_INTERVAL_SECONDS)
+        waited_seconds += ISOLATION_WAIT_INTERVAL_SECONDS
+        isolated_processes_no = isolate_service_processes(service, cpus, io_priority)
+    isolated_processes_per_service[service] = isolated_processes_no
+    if not isolated_processes_no:
+        print(f" !!! WARNING: no {service} process found after {waited_seconds} seconds - it was not isolated")
+        return 0
+    print(f"Isolated {isolated_processes_no} {service} processes on cpus {cpus} (io priority: {io_priority})")
+    return isolated_processes_no
+
+
+def drop_page_cache():
+    # needs root (or passwordless sudo); the page cache is dropped so every phase starts with a cold cache
+    subprocess.run(["sync"], check=False)
+    try:
+        with open("/proc/sys/vm/drop_caches", "w") as drop_caches_file:
+            drop_caches_file.write("3\n")
+        return True
+    except OSError:
+        result = subprocess.run("sudo -n sh -c 'echo 3 > /proc/sys/vm/drop_caches'", shell=True,
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        if result.returncode != 0:
+            print(f" !!! WARNING: could not drop the page cache: {result.stdout.decode('utf-8').strip()}")
+            return False
+        return True
@@ -0,0 +1,134 @@
+import os
+import re
+from collections import Counter
+from datetime import datetime, timezone
+
+
+READ_CHUNK_SIZE = 1024 * 1024
+MAX_LINE_LENGTH = 64 * 1024
+MAX_EVENT_MESSAGE_LENGTH = 512
+
+# [cardano.node.ChainDB:Notice:35] [2022-02-08 10:41:10.23 UTC] <message>
+LOG_LINE_HEADER_RE = re.compile(
+    r"\[(?P<namespace>[^\]]*):(?P<severity>\w+):\d+\] \[(?P<date>\d{4}-\d{2}-\d{2}) "
+    r"(?P<time>\d{2}:\d{2}:\d{2})(?:\.(?P<fraction>\d+))? UTC\] (?P<message>.*)")
+# cheap check done before trying the event patterns one by one
+EVENT_KEYWORDS_RE = re.compile(r"insert|epoch|snapshot|roll|fork|Error", re.IGNORECASE)
+
+EPOCH_RE = re.compile(r"epoch (\d+)", re.IGNORECASE)
+SLOT_RE = re.compile(r"slot (\d+)", re.IGNORECASE)
+BLOCK_RE = re.compile(r"block (\d+)", re.IGNORECASE)
+
+# (event kind, pattern) - the first matching pattern wins
+EVENT_PATTERNS = [
+    ("insert_batch", re.compile(r"insert\w*Block|Insert \w+ Block|Inserted \d+ blocks", re.IGNORECASE)),
+    ("epoch_start", re.compile(r"Starting epoch \d+|Handling epoch \d+|new epoch", re.IGNORECASE)),
+    ("ledger_snapshot", re.compile(r"snapshot", re.IGNORECASE)),
+    ("rollback", re.compile(r"Rolling back|Rollback|Switched to a fork|Deleting \d+ blocks", re.IGNORECASE)),
+]
+
+
+def parse_timestamp(date, time, fraction):
+    fraction = (fraction or "0")[:6].ljust(6, "0")
+    return datetime.fromisoformat(f"{date}T{time}.{fraction}").replace(tzinfo=timezone.utc)
+
+
+def parse_log_line(line):
+    header = LOG_LINE_HEADER_RE.search(line)
+    if not header:
+        return None
+    message = header.group("message")
+    severity = header.group("severity")
+
+    if severity in ("Error", "Critical", "Alert", "Emergency"):
+        kind = "error"
+    elif not EVENT_KEYWORDS_RE.search(message):
+        return None
+    else:
+        kind = next((k for k, pattern in EVENT_PATTERNS if pattern.search(message)), None)
+        if kind is None:
+            return None
+
+    epoch = EPOCH_RE.search(message)
+    slot = SLOT_RE.search(message)
+    block = BLOCK_RE.search(message)
+    return {
+        "timestamp": parse_timestamp(header.group("date"), header.group("time"), header.group("fraction")),
+        "kind": kind,
+        "epoch_no": int(epoch.group(1)) if epoch else None,
+        "slot_no": int(slot.group(1)) if slot else None,
+        "block_no": int(block.group(1)) if block else None,
+        "message": message[:MAX_EVENT_MESSAGE_LENGTH] if kind in ("error", "rollback") else None,
+    }
+
+
+class LogTailer:
+    def __init__(self, file_path, source):
+        self.file_path = file_path
+        self.source = source
+        self.file = None
+        self.inode = None
+        self.offset = 0
+        self.partial_line = b""
+        self.events_count = Counter()
+
+    def _open(self):
+        try:
+            self.file = open(self.file_path, "rb")
+        except FileNotFoundError:
+            self.file = None
+            return False
+        self.inode = os.fstat(self.file.fileno()).st_ino
+        self.offset = 0
+        self.partial_line = b""
+        return True
+
+    def _is_rotated(self):
+        try:
+            stat = os.stat(self.file_path)
+        except FileNotFoundError:
+            return False
+        # a new file was moved in place of the old one or the old one was truncated
+        return stat.st_ino != self.inode or stat.st_size < self.offset
+
+    def read_lines(self):
+        if self.file is None and not self._open():
+            return
+        rotated = self._is_rotated()
+        # read what is left in the current file before switching to the new one after a rotation
+        yield from self._read_available_lines()
+        if rotated:
+            print(f"Log file rotated or truncated: {self.file_path}")
+            self.file.close()
+            if self._open():
+                yield from self._read_available_lines()
+
+    def _read_available_lines(self):
+        self.file.seek(self.offset)
+        while True:
+            chunk = self.file.read(READ_CHUNK_SIZE)
+            if not chunk:
+                return
+            self.offset += len(chunk)
+            lines = (self.partial_line + chunk).split(b"\n")
+            # the last element is an incomplete line (or b"" when the chunk ended with a newline)
+            self.partial_line = lines.pop()[:MAX_LINE_LENGTH]
+            for line in lines:
+                yield line[:MAX_LINE_LENGTH].decode("utf-8", errors="replace")
+
+    def poll(self, run_archive=None):
+        events_no = 0
+        for line in self.read_lines():
+            event = parse_log_line(line)
+            if event is None:
+                continue
+            events_no += 1
+            self.events_count[event["kind"]] += 1
+            if run_archive is not None:
+                run_archive.add_event(self.source, **event)
+        return events_no
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,93 @@
+import math
+import re
+import time
+
+import requests
+
+
+NODE_METRICS_URL = "http://127.0.0.1:12798/metrics"
+DB_SYNC_METRICS_URL = "http://127.0.0.1:8080/metrics"
+SCRAPE_TIMEOUT_SECONDS = 5
+
+# <metric name>{<labels>} <value> [<timestamp>]
+METRIC_LINE_RE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)(?:\s+-?\d+)?\s*$")
+METRIC_LABEL_RE = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+# metrics mapped to the columns of the samples stream (the same one fed by the tip probes)
+SAMPLE_FIELDS_BY_METRIC = {
+    "cardano_node_metrics_epoch_int": "epoch_no",
+    "cardano_node_metrics_slotNum_int": "slot_no",
+    "cardano_node_metrics_blockNum_int": "block_no",
+    "cardano_node_metrics_Mem_resident_int": "ram_bytes",
+    "cardano_db_sync_db_slot_height": "slot_no",
+    "cardano_db_sync_db_block_height": "block_no",
+}
+
+
+def parse_metric_labels(labels):
+    if not labels:
+        return {}
+    return {name: value for name, value in METRIC_LABEL_RE.findall(labels)}
+
+
+def parse_prometheus_lines(lines):
+    for line in lines:
+        if not line or line.startswith("#"):
+            continue
+        match = METRIC_LINE_RE.match(line)
+        if not match:
+            continue
+        try:
+            value = float(match.group(3))
+        except ValueError:
+            continue
+        if math.isnan(value):
+            continue
+        yield match.group(1), parse_metric_labels(match.group(2)), value
+
+
+class MetricsScraper:
+    def __init__(self, endpoints, metric_prefixes=None, timeout=SCRAPE_TIMEOUT_SECONDS):
+        # endpoints: {source name: url}; a single keep-alive session is reused for all the scrapes
+        self.endpoints = {source: url for source, url in endpoints.items() if url}
+        self.metric_prefixes = tuple(metric_prefixes) if metric_prefixes else None
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.unavailable_endpoints = set()
+        self.scrapes_count = 0
+
+    def scrape_endpoint(self, source, url, run_archive=None):
+        timestamp = time.time()
+        sample = {}
+        metrics_no = 0
+        with self.session.get(url, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            # the exposition text is parsed line by line, as it is received
+            for name, labels, value in parse_prometheus_lines(response.iter_lines(decode_unicode=True)):
+                if name in SAMPLE_FIELDS_BY_METRIC:
+                    sample[SAMPLE_FIELDS_BY_METRIC[name]] = int(value)
+                if self.metric_prefixes and not name.startswith(self.metric_prefixes):
+                    continue
+                metrics_no += 1
+                if run_archive is not None:
+                    run_archive.add_metric(source, name, value, labels=labels, timestamp=timestamp)
+        if sample and run_archive is not None:
+            run_archive.add_sample(source, timestamp=timestamp, **sample)
+        return sample, metrics_no
+
+    def scrape(self, run_archive=None):
+        samples = {}
+        for source, url in self.endpoints.items():
+            try:
+                samples[source], _ = self.scrape_endpoint(source, url, run_archive)
+                self.unavailable_endpoints.discard(source)
+            except requests.exceptions.RequestException as e:
+                # only reported once - the services expose their metrics only after they started
+                if source not in self.unavailable_endpoints:
+                    print(f" !!! WARNING: failed to scrape the {source} metrics from {url}: {e}")
+                    self.unavailable_endpoints.add(source)
+        self.scrapes_count += 1
+        return samples
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,215 @@
+import json
+import os
+import time
+from collections import OrderedDict
+
+import psycopg2
+import pyarrow as pa
+import pyarrow.parquet as pq
+import zstandard
+
+from tracing_utils import traced
+
+
+EXPORT_BATCH_SIZE = 10000
+ZSTD_COMPRESSION_LEVEL = 3
+
+# postgres type OIDs (pg_type.oid) mapped to the pyarrow column types used in the parquet exports
+PG_TYPE_TO_ARROW_TYPE = {
+    16: pa.bool_(),
+    17: pa.binary(),
+    20: pa.int64(),
+    21: pa.int16(),
+    23: pa.int32(),
+    25: pa.string(),
+    700: pa.float32(),
+    701: pa.float64(),
+    1042: pa.string(),
+    1043: pa.string(),
+    1082: pa.date32(),
+    1114: pa.timestamp("us"),
+    1184: pa.timestamp("us", tz="UTC"),
+}
+PG_NUMERIC_TYPE_OID = 1700
+
+
+def create_db_sync_connection(db_name):
+    # host, port and user are taken from the PGHOST, PGPORT and PGUSER env vars set in setup_postgres()
+    conn = psycopg2.connect(dbname=db_name)
+    conn.set_session(readonly=True, autocommit=False)
+    return conn
+
+
+def has_tables(db_name, table_names):
+    # False as well when the database does not exist (yet)
+    try:
+        conn = create_db_sync_connection(db_name)
+    except psycopg2.Error:
+        return False
+    try:
+        with conn.cursor() as cur:
+            for table_name in table_names:
+                cur.execute("SELECT to_regclass(%s);", (table_name,))
+                if cur.fetchone()[0] is None:
+                    return False
+        return True
+    finally:
+        conn.close()
+
+
+def get_table_select_query(table_name, columns=None, order_by="id"):
+    select_columns = ", ".join(columns) if columns else "*"
+    sql_query = f"SELECT {select_columns} FROM {table_name}"
+    if order_by:
+        sql_query += f" ORDER BY {order_by}"
+    return sql_query
+
+
+class CountingWriter:
+    def __init__(self, file):
+        self.file = file
+        self.bytes_written = 0
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        return self.file.write(data)
+
+
+def export_table_to_ndjson_zst(conn, table_name, file_path, columns=None, order_by="id"):
+    print(f"Exporting {table_name} table to {file_path} (zstd compressed NDJSON)")
+    select_query = get_table_select_query(table_name, columns, order_by)
+    # csv format with delimiter/quote characters that never appear in json text makes
+    # postgres stream every row_to_json() value as a raw line (text format would escape backslashes)
+    copy_query = f"COPY (SELECT row_to_json(t) FROM ({select_query}) t) TO STDOUT " \
+                 f"WITH (FORMAT csv, DELIMITER E'\\x02', QUOTE E'\\x01')"
+    print(f"  -- sql_query: {copy_query}")
+
+    start_export = time.perf_counter()
+    compressor = zstandard.ZstdCompressor(level=ZSTD_COMPRESSION_LEVEL, threads=-1)
+    with open(file_path, "wb") as out_file:
+        with compressor.stream_writer(out_file, closefd=False) as zstd_writer:
+            counting_writer = CountingWriter(zstd_writer)
+            with conn.cursor() as cur:
+                cur.copy_expert(copy_query, counting_writer)
+                rows_no = cur.rowcount
+    export_time = time.perf_counter() - start_export
+
+    print(f"  -- exported {rows_no} rows ({counting_writer.bytes_written} bytes uncompressed, "
+          f"{os.path.getsize(file_path)} bytes compressed) in {round(export_time, 2)} seconds")
+    return rows_no
+
+
+def get_arrow_type(column):
+    if column.type_code == PG_NUMERIC_TYPE_OID:
+        # db-sync stores lovelace amounts as numeric(20,0) so they do not fit into an int64
+        if column.precision is not None and 0 < column.precision <= 38:
+            return pa.decimal128(column.precision, column.scale or 0)
+        return pa.string()
+    return PG_TYPE_TO_ARROW_TYPE.get(column.type_code, pa.string())
+
+
+def convert_column_values(values, arrow_type):
+    if pa.types.is_binary(arrow_type):
+        return [None if v is None else bytes(v) for v in values]
+    if pa.types.is_string(arrow_type):
+        return [None if v is None or isinstance(v, str) else
+                json.dumps(v, default=str) if isinstance(v, (dict, list)) else str(v) for v in values]
+    return values
+
+
+def export_table_to_parquet(conn, table_name, file_path, columns=None, order_by="id",
+                            batch_size=EXPORT_BATCH_SIZE):
+    print(f"Exporting {table_name} table to {file_path} (zstd compressed Parquet)")
+    sql_query = get_table_select_query(table_name, columns, order_by)
+    print(f"  -- sql_query: {sql_query}")
+
+    start_export = time.perf_counter()
+    rows_no = 0
+    writer = None
+    # named (server side) cursor - rows are streamed from postgres in batches of batch_size
+    with conn.cursor(name=f"export_{table_name}") as cur:
+        cur.itersize = batch_size
+        cur.execute(sql_query)
+        try:
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if writer is None:
+                    schema = pa.schema([(col.name, get_arrow_type(col)) for col in cur.description])
+                    writer = pq.ParquetWriter(file_path, schema, compression="zstd")
+                if not rows:
+                    break
+                arrays = [pa.array(convert_column_values([row[i] for row in rows], field.type), type=field.type)
+                          for i, field in enumerate(schema)]
+                writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+                rows_no += len(rows)
+        finally:
+            if writer is not None:
+                writer.close()
+    export_time = time.perf_counter() - start_export
+
+    print(f"  -- exported {rows_no} rows ({os.path.getsize(file_path)} bytes compressed) "
+          f"in {round(export_time, 2)} seconds")
+    return rows_no
+
+
+@traced
+def export_table(conn, table_name, file_path, columns=None, order_by="id"):
+    if str(file_path).endswith(".parquet"):
+        return export_table_to_parquet(conn, table_name, file_path, columns, order_by)
+    elif str(file_path).endswith(".ndjson.zst"):
+        return export_table_to_ndjson_zst(conn, table_name, file_path, columns, order_by)
+    else:
+        raise Exception(f"Unsupported export file format: {file_path} - use .parquet or .ndjson.zst")
+
+
+@traced
+def export_tables(db_name, table_names, output_dir, file_format="parquet"):
+    exported_files = []
+    conn = create_db_sync_connection(db_name)
+    try:
+        for table_name in table_names:
+            file_path = os.path.join(output_dir, f"{table_name}.{file_format}")
+            export_table(conn, table_name, file_path)
+            exported_files.append(file_path)
+    finally:
+        conn.close()
+    return exported_files
+
+
+# block.proto_major -> era name (protocol versions 5 and 6 are both Alonzo)
+PROTOCOL_MAJOR_VERSION_TO_ERA = {
+    0: "byron", 1: "byron", 2: "shelley", 3: "allegra", 4: "mary", 5: "alonzo", 6: "alonzo", 7: "babbage"
+}
+
+
+def get_epoch_sync_times(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT no, seconds, state FROM epoch_sync_time ORDER BY no;")
+        return cur.fetchall()
+
+
+def get_epoch_block_stats(conn):
+    # blocks, transactions and bytes of every epoch, in a single grouped query
+    sql_query = "SELECT epoch_no, count(*), COALESCE(sum(tx_count), 0), COALESCE(sum(size), 0) " \
+                "FROM block WHERE epoch_no IS NOT NULL GROUP BY epoch_no ORDER BY epoch_no;"
+    with conn.cursor() as cur:
+        cur.execute(sql_query)
+        return cur.fetchall()
+
+
+def get_era_stats(conn):
+    sql_query = "SELECT proto_major, min(epoch_no), max(epoch_no), min(time), max(time), count(*) " \
+                "FROM block WHERE epoch_no IS NOT NULL GROUP BY proto_major ORDER BY min(epoch_no);"
+    era_stats = OrderedDict()
+    with conn.cursor() as cur:
+        cur.execute(sql_query)
+        for proto_major, start_epoch, end_epoch, start_time, end_time, blocks_no in cur.fetchall():
+            era = PROTOCOL_MAJOR_VERSION_TO_ERA.get(proto_major, f"protocol_{proto_major}")
+            if era in era_stats:
+                era_stats[era]["end_epoch"] = end_epoch
+                era_stats[era]["end_time"] = end_time
+                era_stats[era]["blocks_in_era"] += blocks_no
+            else:
+                era_stats[era] = {"start_epoch": start_epoch, "end_epoch": end_epoch, "start_time": start_time,
+                                  "end_time": end_time, "blocks_in_era": blocks_no}
+    return era_stats
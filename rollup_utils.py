@@ -0,0 +1,197 @@
+import argparse
+from collections import OrderedDict
+
+import pandas as pd
+
+from aws_db_utils import add_bulk_values_into_db, create_table, execute_sql_query, iter_query_rows, \
+    iter_table_chunks, check_sql_identifier
+from tracing_utils import traced
+
+
+RAW_SAMPLES_RESOLUTION_SECONDS = 1
+# rollup table suffix -> bucket size in seconds
+ROLLUP_RESOLUTIONS = OrderedDict([("1m", 60), ("1h", 3600)])
+ROLLUP_METRICS = ["ram_bytes", "cpu_percent"]
+ROLLUP_AGGREGATES = ["min", "avg", "max", "p95"]
+RAW_SAMPLES_COLUMNS = ["timestamp", "slot_no", "ram_bytes", "cpu_percent"]
+RAW_SAMPLES_RETENTION_RUNS = 20
+
+
+def get_raw_samples_table(env):
+    return check_sql_identifier(f"{env}_logs")
+
+
+def get_rollup_table(env, resolution):
+    return check_sql_identifier(f"{env}_logs_{resolution}")
+
+
+def get_rollup_columns():
+    return ["identifier", "bucket_start", "samples_no", "slot_no_max"] + \
+           [f"{metric}_{aggregate}" for metric in ROLLUP_METRICS for aggregate in ROLLUP_AGGREGATES]
+
+
+@traced
+def create_rollup_tables(env):
+    metric_columns = "".join(f" {metric}_{aggregate} double DEFAULT NULL,"
+                             for metric in ROLLUP_METRICS for aggregate in ROLLUP_AGGREGATES)
+    for resolution in ROLLUP_RESOLUTIONS:
+        create_table(
+            f"CREATE TABLE IF NOT EXISTS {get_rollup_table(env, resolution)} ("
+            " identifier varchar(255) NOT NULL,"
+            " bucket_start datetime NOT NULL,"
+            " samples_no int NOT NULL,"
+            " slot_no_max bigint DEFAULT NULL,"
+            f"{metric_columns}"
+            " PRIMARY KEY (identifier, bucket_start)"
+            " ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci"
+        )
+
+
+def aggregate_buckets(samples_df, bucket_seconds):
+    grouped = samples_df.groupby(samples_df["timestamp"].dt.floor(f"{bucket_seconds}s"))
+    aggregates = OrderedDict()
+    aggregates["samples_no"] = grouped.size()
+    aggregates["slot_no_max"] = grouped["slot_no"].max()
+    for metric in ROLLUP_METRICS:
+        aggregates[f"{metric}_min"] = grouped[metric].min()
+        aggregates[f"{metric}_avg"] = grouped[metric].mean()
+        aggregates[f"{metric}_max"] = grouped[metric].max()
+        aggregates[f"{metric}_p95"] = grouped[metric].quantile(0.95)
+    buckets_df = pd.DataFrame(aggregates)
+    buckets_df.index.name = "bucket_start"
+    return buckets_df.reset_index()
+
+
+def split_last_bucket(samples_df, bucket_seconds):
+    # the samples are read ordered by time, so only the last bucket of a chunk can continue in the next one
+    buckets = samples_df["timestamp"].dt.floor(f"{bucket_seconds}s")
+    is_last_bucket = buckets == buckets.iloc[-1]
+    return samples_df[~is_last_bucket], samples_df[is_last_bucket]
+
+
+@traced
+def rollup_run_samples(env, identifier):
+    print(f"Rolling up the {identifier} samples of the {get_raw_samples_table(env)} table into "
+          f"{[get_rollup_table(env, r) for r in ROLLUP_RESOLUTIONS]}")
+    carried_samples = {resolution: None for resolution in ROLLUP_RESOLUTIONS}
+    rollups = {resolution: [] for resolution in ROLLUP_RESOLUTIONS}
+
+    # a single streaming pass over the raw samples of the run feeds all the resolutions
+    for chunk in iter_table_chunks(get_raw_samples_table(env), RAW_SAMPLES_COLUMNS, identifier=identifier,
+                                   order_by="timestamp"):
+        chunk["timestamp"] = pd.to_datetime(chunk["timestamp"])
+        for column in RAW_SAMPLES_COLUMNS[1:]:
+            chunk[column] = pd.to_numeric(chunk[column], errors="coerce")
+        for resolution, bucket_seconds in ROLLUP_RESOLUTIONS.items():
+            samples_df = chunk if carried_samples[resolution] is None else \
+                pd.concat([carried_samples[resolution], chunk], ignore_index=True)
+            complete_samples_df, carried_samples[resolution] = split_last_bucket(samples_df, bucket_seconds)
+            if not complete_samples_df.empty:
+                rollups[resolution].append(aggregate_buckets(complete_samples_df, bucket_seconds))
+
+    rows_no = {}
+    for resolution, bucket_seconds in ROLLUP_RESOLUTIONS.items():
+        if carried_samples[resolution] is not None and not carried_samples[resolution].empty:
+            rollups[resolution].append(aggregate_buckets(carried_samples[resolution], bucket_seconds))
+        rollup_table = get_rollup_table(env, resolution)
+        # re-running the rollup of a run replaces its buckets
+        execute_sql_query(f"DELETE FROM {rollup_table} WHERE identifier = %s", (identifier,))
+        if not rollups[resolution]:
+            rows_no[resolution] = 0
+            continue
+        rollup_df = pd.concat(rollups[resolution], ignore_index=True)
+        rollup_df.insert(0, "identifier", identifier)
+        rollup_df["bucket_start"] = rollup_df["bucket_start"].dt.strftime("%Y-%m-%d %H:%M:%S")
+        rollup_df = rollup_df.astype(object).where(pd.notnull(rollup_df), None)
+        add_bulk_values_into_db(rollup_table, list(rollup_df.columns), rollup_df.values.tolist())
+        rows_no[resolution] = len(rollup_df)
+    return rows_no
+
+
+def get_run_identifiers(env):
+    # newest first (same ordering as get_identifier_last_run_from_table())
+    sql_query = f"SELECT identifier FROM {check_sql_identifier(env)} ORDER BY LPAD(LOWER(identifier), 500, 0) DESC"
+    return [row[0] for rows in iter_query_rows(sql_query) for row in rows]
+
+
+def has_rolled_up_samples(env, identifier, resolution="1h"):
+    sql_query = f"SELECT 1 FROM {get_rollup_table(env, resolution)} WHERE identifier = %s LIMIT 1"
+    return any(rows for rows in iter_query_rows(sql_query, (identifier,)))
+
+
+def has_raw_samples(env, identifier):
+    sql_query = f"SELECT 1 FROM {get_raw_samples_table(env)} WHERE identifier = %s LIMIT 1"
+    return any(rows for rows in iter_query_rows(sql_query, (identifier,)))
+
+
+@traced
+def prune_raw_samples(env, keep_runs=RAW_SAMPLES_RETENTION_RUNS):
+    # the raw samples of all but the newest keep_runs runs are deleted - only when they were rolled up
+    pruned_identifiers = []
+    for identifier in get_run_identifiers(env)[keep_runs:]:
+        if not has_rolled_up_samples(env, identifier):
+            print(f" !!! WARNING: not pruning the raw samples of {identifier} - they were not rolled up")
+            continue
+        pruned_identifiers.append(identifier)
+    if not pruned_identifiers:
+        return 0
+    print(f"Pruning the raw samples of {len(pruned_identifiers)} runs from {get_raw_samples_table(env)}")
+    return execute_sql_query(f"DELETE FROM {get_raw_samples_table(env)} "
+                             f"WHERE identifier IN ({', '.join(['%s'] * len(pruned_identifiers))})",
+                             pruned_identifiers)
+
+
+def get_samples_resolution(env, identifier, max_resolution_seconds):
+    # the coarsest stored resolution that is still fine enough for the query
+    resolutions = [("raw", RAW_SAMPLES_RESOLUTION_SECONDS)] + list(ROLLUP_RESOLUTIONS.items())
+    eligible_resolutions = [r for r, seconds in resolutions if seconds <= max_resolution_seconds] or ["raw"]
+    resolution = eligible_resolutions[-1]
+    if resolution == "raw" and not has_raw_samples(env, identifier):
+        print(f"The raw samples of {identifier} were pruned - using the 1 minute rollups")
+        resolution = next(iter(ROLLUP_RESOLUTIONS))
+    return resolution
+
+
+def iter_samples(env, identifier, start_time=None, end_time=None,
+                 max_resolution_seconds=RAW_SAMPLES_RESOLUTION_SECONDS):
+    resolution = get_samples_resolution(env, identifier, max_resolution_seconds)
+    if resolution == "raw":
+        chunks = iter_table_chunks(get_raw_samples_table(env), ["identifier"] + RAW_SAMPLES_COLUMNS, identifier,
+                                   start_time, end_time, order_by="timestamp")
+    else:
+        chunks = iter_table_chunks(get_rollup_table(env, resolution), get_rollup_columns(), identifier,
+                                   start_time, end_time, time_column="bucket_start", order_by="bucket_start")
+    for chunk in chunks:
+        yield resolution, chunk
+
+
+def get_samples(env, identifier, start_time=None, end_time=None,
+                max_resolution_seconds=RAW_SAMPLES_RESOLUTION_SECONDS):
+    resolution = None
+    chunks = []
+    for resolution, chunk in iter_samples(env, identifier, start_time, end_time, max_resolution_seconds):
+        chunks.append(chunk)
+    return resolution, pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+
+
+def main():
+    env = vars(args)["environment"]
+    create_rollup_tables(env)
+    identifiers = [vars(args)["identifier"]] if vars(args)["identifier"] else get_run_identifiers(env)
+    for identifier in identifiers:
+        print(f"  ==== {identifier}: {rollup_run_samples(env, identifier)} rollup rows")
+    if vars(args)["keep_runs"] is not None:
+        prune_raw_samples(env, int(vars(args)["keep_runs"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Roll up the resource samples of the sync tests\n\n")
+
+    parser.add_argument("-e", "--environment",
+                        help="The environment of the results tables - shelley_qa, testnet, staging or mainnet.")
+    parser.add_argument("-i", "--identifier", help="The run to roll up (default: all the runs).")
+    parser.add_argument("-k", "--keep_runs", help="Prune the raw samples of all but the newest N runs.")
+
+    args = parser.parse_args()
+
+    main()
@@ -0,0 +1,171 @@
+import json
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+
+RUN_ARCHIVE_DIR_NAME = 'run_archive'
+RUN_SUMMARY_FILE_NAME = 'summary.json'
+ARCHIVE_BATCH_SIZE = 1000
+
+ARCHIVE_SCHEMAS = {
+    "samples": pa.schema([
+        ("timestamp", pa.timestamp("ms", tz="UTC")),
+        ("source", pa.string()),
+        ("epoch_no", pa.int32()),
+        ("slot_no", pa.int64()),
+        ("block_no", pa.int64()),
+        ("ram_bytes", pa.int64()),
+        ("cpu_percent", pa.float64()),
+    ]),
+    "epochs": pa.schema([
+        ("epoch_no", pa.int32()),
+        ("sync_duration_secs", pa.float64()),
+        ("state", pa.string()),
+    ]),
+    "eras": pa.schema([
+        ("era", pa.string()),
+        ("start_epoch", pa.int32()),
+        ("end_epoch", pa.int32()),
+        ("start_time", pa.timestamp("ms", tz="UTC")),
+        ("end_time", pa.timestamp("ms", tz="UTC")),
+        ("blocks_in_era", pa.int64()),
+        ("sync_duration_secs", pa.float64()),
+    ]),
+    "events": pa.schema([
+        ("timestamp", pa.timestamp("ms", tz="UTC")),
+        ("source", pa.string()),
+        ("kind", pa.string()),
+        ("epoch_no", pa.int32()),
+        ("slot_no", pa.int64()),
+        ("block_no", pa.int64()),
+        ("message", pa.string()),
+    ]),
+    "metrics": pa.schema([
+        ("timestamp", pa.timestamp("ms", tz="UTC")),
+        ("source", pa.string()),
+        ("name", pa.string()),
+        ("labels", pa.string()),
+        ("value", pa.float64()),
+    ]),
+}
+
+
+def to_timestamp_ms(value):
+    # accepts unix timestamps (as returned by time.time()) and datetime objects (naive ones are UTC - like
+    # the db-sync block.time values)
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        value = value.timestamp()
+    return int(value * 1000)
+
+
+class RunArchiveWriter:
+    def __init__(self, archive_dir, run_id, batch_size=ARCHIVE_BATCH_SIZE):
+        self.run_id = run_id
+        self.run_dir = Path(archive_dir) / run_id
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.writers = {}
+        self.buffers = {}
+
+    def add_row(self, kind, **values):
+        schema = ARCHIVE_SCHEMAS[kind]
+        if kind not in self.buffers:
+            self.buffers[kind] = {name: [] for name in schema.names}
+        buffer = self.buffers[kind]
+        for name in schema.names:
+            value = values.get(name)
+            if pa.types.is_timestamp(schema.field(name).type):
+                value = to_timestamp_ms(value)
+            buffer[name].append(value)
+        if len(buffer[schema.names[0]]) >= self.batch_size:
+            self.flush(kind)
+
+    def add_sample(self, source, timestamp=None, **values):
+        self.add_row("samples", source=source, timestamp=timestamp or time.time(), **values)
+
+    def add_epoch(self, epoch_no, sync_duration_secs, state=None):
+        self.add_row("epochs", epoch_no=epoch_no, sync_duration_secs=sync_duration_secs, state=state)
+
+    def add_era(self, era, **values):
+        self.add_row("eras", era=era, **values)
+
+    def add_event(self, source, **values):
+        self.add_row("events", source=source, **values)
+
+    def add_metric(self, source, name, value, labels=None, timestamp=None):
+        labels = ",".join(f"{k}={v}" for k, v in sorted(labels.items())) if labels else None
+        self.add_row("metrics", source=source, name=name, labels=labels, value=value,
+                     timestamp=timestamp or time.time())
+
+    def flush(self, kind):
+        buffer = self.buffers.get(kind)
+        schema = ARCHIVE_SCHEMAS[kind]
+        if not buffer or not buffer[schema.names[0]]:
+            return
+        if kind not in self.writers:
+            # the arrow IPC file format (not the stream one) is used so that the files can be memory-mapped
+            self.writers[kind] = ipc.new_file(str(self.run_dir / f"{kind}.arrow"), schema)
+        batch = pa.RecordBatch.from_arrays(
+            [pa.array(buffer[name], type=schema.field(name).type) for name in schema.names], schema=schema)
+        self.writers[kind].write_batch(batch)
+        self.buffers[kind] = {name: [] for name in schema.names}
+
+    def close(self, summary=None):
+        for kind in list(self.buffers):
+            self.flush(kind)
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+        if summary is not None:
+            with open(self.run_dir / RUN_SUMMARY_FILE_NAME, 'w') as summary_file:
+                json.dump(summary, summary_file, indent=2)
+        print(f"Run archive written to: {self.run_dir}")
+
+
+def get_run_files(archive_dir, run_id):
+    return sorted(str(f) for f in (Path(archive_dir) / run_id).iterdir() if f.is_file())
+
+
+def get_archived_run_ids(archive_dir):
+    return sorted(d.name for d in Path(archive_dir).iterdir() if d.is_dir())
+
+
+def load_run_summaries(archive_dir, run_ids=None):
+    summaries = {}
+    for run_id in run_ids or get_archived_run_ids(archive_dir):
+        summary_file_path = Path(archive_dir) / run_id / RUN_SUMMARY_FILE_NAME
+        if summary_file_path.is_file():
+            with open(summary_file_path, "r") as summary_file:
+                summaries[run_id] = json.load(summary_file)
+    return summaries
+
+
+def load_runs(archive_dir, kind, run_ids=None, columns=None):
+    # the record batches are memory-mapped (zero-copy), only the added run_id column is allocated
+    tables = []
+    for run_id in run_ids or get_archived_run_ids(archive_dir):
+        file_path = Path(archive_dir) / run_id / f"{kind}.arrow"
+        if not file_path.is_file():
+            continue
+        table = ipc.open_file(pa.memory_map(str(file_path), "r")).read_all()
+        if columns:
+            table = table.select(columns)
+        run_id_column = pa.DictionaryArray.from_arrays(
+            pa.array(np.zeros(table.num_rows, dtype=np.int32)), pa.array([run_id]))
+        table = table.append_column("run_id", run_id_column)
+        tables.append(table)
+    if not tables:
+        schema = ARCHIVE_SCHEMAS[kind]
+        if columns:
+            schema = pa.schema([schema.field(c) for c in columns])
+        return schema.empty_table().append_column("run_id", pa.array([], type=pa.dictionary(pa.int32(), pa.string())))
+    return pa.concat_tables(tables)
@@ -8,9 +8,15 @@ export PGPASSFILE=config/pgpass-$ENVIRONMENT
 echo "/tmp/postgres:5432:${ENVIRONMENT}:postgres:*" > $PGPASSFILE
 chmod 600 $PGPASSFILE
 
-PGPASSFILE=$PGPASSFILE scripts/postgresql-setup.sh --createdb
+# the database already exists when it was restored from a snapshot
+if [ -z "${DB_SYNC_SKIP_CREATEDB:-}" ]; then
+  PGPASSFILE=$PGPASSFILE scripts/postgresql-setup.sh --createdb
+fi
 
-nix-build -A cardano-db-sync -o db-sync-node
+# db-sync-node is normally linked to a cached build by db_sync_tests.py
+if [ ! -e db-sync-node ]; then
+  nix-build -A cardano-db-sync -o db-sync-node
+fi
 
 export DbSyncAbortOnPanic=1
 
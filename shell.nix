@@ -4,10 +4,14 @@ let
   my-python = pkgs.python3;
   python-with-my-packages = my-python.withPackages (p: with p; [
     pandas
+    numpy
     requests
     psutil
     GitPython
     pymysql
+    psycopg2
+    pyarrow
+    zstandard
     # other python packages if needed
   ]);
 in
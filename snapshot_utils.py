@@ -0,0 +1,69 @@
+import json
+import shutil
+import subprocess
+import time
+from pathlib import Path
+
+from tracing_utils import traced
+from utils import get_no_of_cpu_cores, get_current_date_time
+
+
+SNAPSHOT_DB_DIR_NAME = 'db'
+SNAPSHOT_LEDGER_STATE_DIR_NAME = 'ledger-state'
+SNAPSHOT_METADATA_FILE_NAME = 'snapshot.json'
+
+
+def run_pg_command(cmd):
+    print(f"  -- cmd: {' '.join(cmd)}")
+    try:
+        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(
+            "command '{}' return with error (code {}): {}".format(
+                e.cmd, e.returncode, " ".join(str(e.output).split())
+            )
+        )
+
+
+@traced
+def restore_db_sync_snapshot(snapshot_dir, db_name, ledger_state_dir, jobs=None):
+    # snapshot_dir contains a directory format pg_dump (db/) and the matching db-sync ledger-state/ files
+    snapshot_dir = Path(snapshot_dir)
+    jobs = jobs or get_no_of_cpu_cores()
+    print(f"Restoring the db-sync snapshot from {snapshot_dir} into the {db_name} database ({jobs} jobs)")
+
+    start_restore = time.perf_counter()
+    run_pg_command(["createdb", "-T", "template0", "--encoding=UTF8", db_name])
+    run_pg_command(["pg_restore", "-j", str(jobs), "--no-owner", "-d", db_name,
+                    str(snapshot_dir / SNAPSHOT_DB_DIR_NAME)])
+    if Path(ledger_state_dir).exists():
+        shutil.rmtree(ledger_state_dir)
+    shutil.copytree(snapshot_dir / SNAPSHOT_LEDGER_STATE_DIR_NAME, ledger_state_dir)
+    restore_time_seconds = int(time.perf_counter() - start_restore)
+
+    print(f" === Restoring the db-sync snapshot took {restore_time_seconds} seconds")
+    return restore_time_seconds
+
+
+@traced
+def capture_db_sync_snapshot(snapshot_dir, db_name, ledger_state_dir, epoch_no=None, block_no=None, jobs=None):
+    # db-sync has to be stopped before, so the dump and the ledger state files are consistent
+    snapshot_dir = Path(snapshot_dir)
+    jobs = jobs or get_no_of_cpu_cores()
+    print(f"Capturing a db-sync snapshot of the {db_name} database into {snapshot_dir} ({jobs} jobs)")
+
+    start_capture = time.perf_counter()
+    if snapshot_dir.exists():
+        shutil.rmtree(snapshot_dir)
+    snapshot_dir.mkdir(parents=True)
+    run_pg_command(["pg_dump", "-Fd", "-j", str(jobs), "-f", str(snapshot_dir / SNAPSHOT_DB_DIR_NAME), db_name])
+    shutil.copytree(ledger_state_dir, snapshot_dir / SNAPSHOT_LEDGER_STATE_DIR_NAME)
+    capture_time_seconds = int(time.perf_counter() - start_capture)
+
+    with open(snapshot_dir / SNAPSHOT_METADATA_FILE_NAME, 'w') as metadata_file:
+        json.dump({"db_name": db_name, "epoch_no": epoch_no, "block_no": block_no,
+                   "capture_time": get_current_date_time(), "capture_time_in_sec": capture_time_seconds},
+                  metadata_file, indent=2)
+
+    print(f" === Capturing the db-sync snapshot took {capture_time_seconds} seconds")
+    return capture_time_seconds
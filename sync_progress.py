@@ -0,0 +1,83 @@
+from collections import deque
+
+
+MIN_POLL_INTERVAL_SECONDS = 10
+MAX_POLL_INTERVAL_SECONDS = 300
+THROUGHPUT_WINDOW_SECONDS = 1800
+STALL_TIMEOUT_SECONDS = 3600
+# poll ~20 times over the remaining (estimated) sync time
+POLLS_PER_ETA = 20
+
+
+class SyncStalledError(Exception):
+    def __init__(self, reason, elapsed_seconds, diagnostics=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.elapsed_seconds = elapsed_seconds
+        self.diagnostics = diagnostics or {}
+
+
+class SyncProgressModel:
+    # the ETA is estimated from the db-sync sync progress (the wall clock based sync_percent, the value the
+    # completion condition uses) - not from the lag behind the node tip, which is ~0 whenever db-sync keeps
+    # up with a node that is still syncing itself
+    def __init__(self, target_progress, stall_timeout_seconds=STALL_TIMEOUT_SECONDS,
+                 window_seconds=THROUGHPUT_WINDOW_SECONDS, min_poll_interval=MIN_POLL_INTERVAL_SECONDS,
+                 max_poll_interval=MAX_POLL_INTERVAL_SECONDS):
+        self.target_progress = target_progress
+        self.stall_timeout_seconds = stall_timeout_seconds
+        self.window_seconds = window_seconds
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max_poll_interval
+        # (time, db-sync progress) observations inside the throughput window
+        self.observations = deque()
+        self.last_progress = None
+        self.last_block_no = None
+        self.last_progress_time = None
+
+    def add_observation(self, timestamp, block_no, progress):
+        # the stall detection follows block_no, the ETA follows the progress
+        if self.last_block_no is None or block_no > self.last_block_no or self.last_progress_time is None:
+            self.last_progress_time = timestamp
+        self.last_block_no = block_no
+        self.last_progress = progress
+        self.observations.append((timestamp, progress))
+        while len(self.observations) > 2 and self.observations[0][0] < timestamp - self.window_seconds:
+            self.observations.popleft()
+
+    def reset_stall_timer(self, timestamp):
+        # for expected pauses (ex: db-sync stopped while a snapshot is captured)
+        self.last_progress_time = timestamp
+        self.observations.clear()
+
+    def get_throughput(self):
+        # least squares slope of the progress over time (progress per second) in the recent window
+        n = len(self.observations)
+        if n < 2:
+            return None
+        mean_t = sum(t for t, _ in self.observations) / n
+        mean_p = sum(p for _, p in self.observations) / n
+        variance_t = sum((t - mean_t) ** 2 for t, _ in self.observations)
+        if variance_t == 0:
+            return None
+        return sum((t - mean_t) * (p - mean_p) for t, p in self.observations) / variance_t
+
+    def get_eta_seconds(self):
+        throughput = self.get_throughput()
+        if not throughput or throughput <= 0 or self.last_progress is None:
+            return None
+        return max(0, self.target_progress - self.last_progress) / throughput
+
+    def get_poll_interval(self):
+        eta_seconds = self.get_eta_seconds()
+        if eta_seconds is None:
+            return self.min_poll_interval
+        return min(self.max_poll_interval, max(self.min_poll_interval, eta_seconds / POLLS_PER_ETA))
+
+    def get_seconds_without_progress(self, timestamp):
+        if self.last_progress_time is None:
+            return 0
+        return timestamp - self.last_progress_time
+
+    def is_stalled(self, timestamp):
+        return self.get_seconds_without_progress(timestamp) > self.stall_timeout_seconds
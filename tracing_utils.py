@@ -0,0 +1,85 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+
+TRACE_FILE_NAME = 'harness_trace.json'
+
+# all the timings are relative to the (monotonic) clock value at import time
+_trace_start_ns = time.perf_counter_ns()
+_trace_start_time = datetime.now(timezone.utc)
+_finished_spans = []
+_spans_lock = threading.Lock()
+_thread_local = threading.local()
+
+
+def _get_span_stack():
+    if not hasattr(_thread_local, "stack"):
+        _thread_local.stack = []
+    return _thread_local.stack
+
+
+@contextmanager
+def span(name, **span_args):
+    stack = _get_span_stack()
+    depth = len(stack)
+    stack.append(name)
+    start_ns = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        duration_ns = time.perf_counter_ns() - start_ns
+        stack.pop()
+        with _spans_lock:
+            _finished_spans.append({"name": name, "start_ns": start_ns - _trace_start_ns,
+                                    "duration_ns": duration_ns, "depth": depth,
+                                    "thread_id": threading.get_ident(), "args": span_args})
+
+
+def traced(function=None, name=None):
+    # usable both as @traced and as @traced(name="...")
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    if function is not None:
+        return decorator(function)
+    return decorator
+
+
+def get_phase_durations(depth=0):
+    # total seconds spent in the spans of the given nesting level, by span name - main thread only, the
+    # spans of worker threads (ex: artifact uploads) run inside a main thread span and would be counted twice
+    durations = OrderedDict()
+    main_thread_id = threading.main_thread().ident
+    with _spans_lock:
+        spans = sorted(_finished_spans, key=lambda s: s["start_ns"])
+    for finished_span in spans:
+        if finished_span["depth"] == depth and finished_span["thread_id"] == main_thread_id:
+            durations[finished_span["name"]] = durations.get(finished_span["name"], 0) + \
+                                               finished_span["duration_ns"] / 1e9
+    return OrderedDict((name, round(seconds, 3)) for name, seconds in durations.items())
+
+
+def write_chrome_trace(file_path):
+    # Chrome trace event format (chrome://tracing, https://ui.perfetto.dev) - complete ("X") events in µs
+    pid = os.getpid()
+    with _spans_lock:
+        spans = list(_finished_spans)
+    trace_events = [{"name": s["name"], "cat": "harness", "ph": "X", "pid": pid, "tid": s["thread_id"],
+                     "ts": s["start_ns"] / 1000, "dur": s["duration_ns"] / 1000, "args": s["args"]}
+                    for s in spans]
+    with open(file_path, 'w') as trace_file:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms",
+                   "otherData": {"trace_start_time": _trace_start_time.isoformat()}}, trace_file)
+    print(f"Trace with {len(trace_events)} spans written to: {file_path}")
@@ -1,5 +1,6 @@
 import os
 import platform
+import shutil
 import zipfile
 import signal
 import subprocess
@@ -9,10 +10,13 @@ from pathlib import Path
 from psutil import process_iter
 from datetime import datetime
 from git import Repo
+from git.exc import GitCommandError
 
 import psutil
 import time
 
+from tracing_utils import traced
+
 
 def date_diff_in_seconds(dt2, dt1):
     # dt1 and dt2 should be datetime types
@@ -42,6 +46,7 @@ def export_env_var(name, value):
     os.environ[name] = str(value)
 
 
+@traced
 def clone_repo(repo_name, repo_branch):
     location = os.getcwd() + f"/{repo_name}"
     repo = Repo.clone_from(f"git@github.com:input-output-hk/{repo_name}.git", location)
@@ -50,18 +55,89 @@ def clone_repo(repo_name, repo_branch):
     return location
 
 
-def upload_artifact(file):
+def get_cache_dir():
+    # persistent on the agent between runs
+    return Path(os.environ.get("DB_SYNC_TESTS_CACHE_DIR", Path.home() / ".cache" / "db-sync-tests"))
+
+
+# branches and tags only - a full mirror of a GitHub repo would also fetch every refs/pull/* head
+GIT_MIRROR_FETCH_REFSPECS = ["+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*"]
+
+
+def get_git_mirror_dir(repo_name):
+    return get_cache_dir() / "git-mirrors" / f"{repo_name}.git"
+
+
+def configure_git_mirror_remote(mirror, upstream_url):
+    mirror.git.remote("set-url", "origin", upstream_url)
+    mirror.git.config("--replace-all", "remote.origin.fetch", GIT_MIRROR_FETCH_REFSPECS[0])
+    for refspec in GIT_MIRROR_FETCH_REFSPECS[1:]:
+        mirror.git.config("--add", "remote.origin.fetch", refspec)
+    try:
+        # caches created as full mirrors (git clone --mirror): drop the mirror setting and the pull request refs
+        mirror.git.config("--unset", "remote.origin.mirror")
+        pull_refs = mirror.git.for_each_ref("--format=delete %(refname)", "refs/pull")
+        if pull_refs:
+            subprocess.run(["git", "update-ref", "--stdin"], cwd=mirror.git_dir, input=f"{pull_refs}\n",
+                           universal_newlines=True, check=True)
+    except GitCommandError:
+        pass
+
+
+@traced
+def update_git_mirror(repo_name, upstream_url=None):
+    upstream_url = upstream_url or f"git@github.com:input-output-hk/{repo_name}.git"
+    mirror_dir = get_git_mirror_dir(repo_name)
+    if (mirror_dir / "HEAD").is_file():
+        mirror = Repo(mirror_dir)
+        configure_git_mirror_remote(mirror, upstream_url)
+        # incremental fetch of all branches and tags (refs deleted upstream are pruned)
+        mirror.git.remote("update", "--prune")
+        print(f"Git mirror of {repo_name} updated: {mirror_dir}")
+    else:
+        mirror_dir.parent.mkdir(parents=True, exist_ok=True)
+        mirror = Repo.clone_from(upstream_url, mirror_dir, bare=True)
+        configure_git_mirror_remote(mirror, upstream_url)
+        print(f"Git mirror of {repo_name} created: {mirror_dir}")
+    return mirror
+
+
+@traced
+def checkout_repo_from_mirror(repo_name, repo_branch, upstream_url=None):
+    location = os.getcwd() + f"/{repo_name}"
+    mirror = update_git_mirror(repo_name, upstream_url)
+    if os.path.exists(location):
+        shutil.rmtree(location)
+    # worktrees of previous runs (deleted with their workspace) are forgotten before adding a new one
+    mirror.git.worktree("prune")
+    mirror.git.worktree("add", "--detach", location, repo_branch)
+    print(f"Repo: {repo_name} ({repo_branch}) checked out from mirror {mirror.git_dir} to: {location}")
+    return location
+
+
+@traced
+def upload_artifact(file, timeout=180):
     p = subprocess.Popen(["buildkite-agent", "artifact", "upload", f"{file}"])
-    outs, errs = p.communicate(timeout=180)
+    try:
+        outs, errs = p.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        # no orphaned uploaders left behind when the caller carries on after the timeout
+        p.kill()
+        p.wait()
+        raise
     if outs is not None: print(outs)
+    if p.returncode != 0:
+        raise RuntimeError(f"buildkite-agent failed to upload {file} (code {p.returncode})")
 
 
+@traced
 def print_file(file):
     with open(file) as f:
         contents = f.read()
         print(contents)
 
 
+@traced
 def stop_process(proc_name):
     for proc in process_iter():
         if proc_name in proc.name():
@@ -75,6 +151,71 @@ def stop_process(proc_name):
             print(f" !!! ERROR: {proc_name} process is still active - {proc}")
 
 
+@traced
+def stop_process_gracefully(proc_name, timeout=600):
+    # SIGTERM and wait for the processes to exit; returns False when they had to be killed after the timeout
+    procs = []
+    for proc in process_iter():
+        try:
+            if proc_name in proc.name():
+                print(f" --- Stopping the {proc_name} process - {proc}")
+                proc.send_signal(signal.SIGTERM)
+                procs.append(proc)
+        except psutil.NoSuchProcess:
+            continue
+    _, alive = psutil.wait_procs(procs, timeout=timeout)
+    for proc in alive:
+        print(f" !!! ERROR: {proc_name} process did not exit {timeout} seconds after SIGTERM - killing it - {proc}")
+        proc.kill()
+    psutil.wait_procs(alive, timeout=30)
+    return not alive
+
+
+_monitored_processes = {}
+
+
+def get_process_resources(proc_name):
+    # psutil.Process.cpu_percent() compares against the previous call on the same object so the
+    # processes are cached between calls (the first value of a newly found process is 0.0)
+    ram_bytes = 0
+    cpu_percent = 0.0
+    found = False
+    for proc in process_iter():
+        try:
+            if proc_name not in proc.name():
+                continue
+            proc = _monitored_processes.setdefault(proc.pid, proc)
+            ram_bytes += proc.memory_info().rss
+            cpu_percent += proc.cpu_percent(interval=None)
+            found = True
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            _monitored_processes.pop(proc.pid, None)
+    if not found:
+        return None, None
+    return ram_bytes, cpu_percent
+
+
+def is_process_running(proc_name):
+    for proc in process_iter():
+        try:
+            if proc_name in proc.name():
+                return True
+        except psutil.NoSuchProcess:
+            continue
+    return False
+
+
+def tail_file(file_path, max_bytes=64 * 1024):
+    # the last max_bytes of the file (without reading the whole file)
+    try:
+        with open(file_path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - max_bytes))
+            return f.read().decode("utf-8", errors="replace")
+    except FileNotFoundError:
+        return None
+
+
 def show_percentage(part, whole):
     return round(100 * float(part) / float(whole), 2)
 
@@ -93,6 +234,7 @@ def create_dir(dir_name, root='.'):
     return f"{root}/{dir_name}"
 
 
+@traced
 def get_directory_size(start_path='.'):
     total_size_in_bytes = 0
     for dirpath, dirnames, filenames in os.walk(start_path):
@@ -102,12 +244,14 @@ def get_directory_size(start_path='.'):
     return total_size_in_bytes
 
 
+@traced
 def zip_file(archive_name, file_path):
     with zipfile.ZipFile(archive_name, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=9) as zip:
         file_name = basename(normpath(file_path))
         zip.write(file_path, arcname=file_name)
 
 
+@traced
 def unzip_file(file_name):
     with zipfile.ZipFile(file_name, 'r') as zip:
         zip.printdir()
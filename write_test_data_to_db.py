@@ -6,11 +6,14 @@ import pandas as pd
 from pathlib import Path
 import argparse
 
-from aws_db_utils import get_identifier_last_run_from_table, get_column_names_from_table, \
-    add_column_to_table, add_bulk_values_into_db, add_single_value_into_db, create_table
+from aws_db_utils import get_identifier_last_run_from_table, ensure_table_columns, \
+    add_bulk_values_into_db, add_single_value_into_db, create_table
+from rollup_utils import create_rollup_tables, rollup_run_samples, prune_raw_samples, RAW_SAMPLES_RETENTION_RUNS
+from tracing_utils import write_chrome_trace
 
 
 TEST_RESULTS_FILE_NAME = 'test_results.json'
+WRITE_TEST_DATA_TRACE_FILE_NAME = 'write_test_data_trace.json'
 
 
 def main():
@@ -54,6 +57,7 @@ def main():
     )
     
     create_table(sql_query)
+    write_chrome_trace(WRITE_TEST_DATA_TRACE_FILE_NAME)
 #
 #    print("  ==== Move to 'sync_tests' directory")
 #    os.chdir(current_directory / "sync_tests")
@@ -61,29 +65,18 @@ def main():
 #    print(f"current_directory: {current_directory}")
 #
 #    print("  ==== Check if there are DB columns for all the eras")
-#    print(f"Get the list of the existing eras in test")
-#    eras_in_test = sync_test_results_dict["eras_in_test"].replace("[", "").replace("]", "").replace(
-#        '"', '').split(", ")
+#    eras_in_test = sync_test_results_dict["eras_in_test"]
 #    print(f"eras_in_test: {eras_in_test}")
 #
-#    print(f"Get the column names inside the {env} DB tables")
-#    table_column_names = get_column_names_from_table(env)
-#    print(f"  -- table_column_names: {table_column_names}")
-#
+#    # the column names are read once (and cached) and all the missing columns are added
+#    # with a single ALTER TABLE statement
+#    era_columns = []
 #    for era in eras_in_test:
-#        era_columns = [i for i in table_column_names if i.startswith(era)]
-#        if len(era_columns) != 7:
-#            print(f" === Adding columns for {era} era into the the {env} table")
-#            new_columns_list = [str(era + "_start_time"),
-#                                str(era + "_start_epoch"),
-#                                str(era + "_slots_in_era"),
-#                                str(era + "_start_sync_time"),
-#                                str(era + "_end_sync_time"),
-#                                str(era + "_sync_duration_secs"),
-#                                str(era + "_sync_speed_sps")]
-#            for column_name in new_columns_list:
-#                if column_name not in table_column_names:
-#                    add_column_to_table(env, column_name, "VARCHAR(255)")
+#        for column_suffix in ["_start_time", "_start_epoch", "_slots_in_era", "_start_sync_time",
+#                              "_end_sync_time", "_sync_duration_secs", "_sync_speed_sps"]:
+#            era_columns.append((era + column_suffix, "VARCHAR(255)"))
+#    if not ensure_table_columns(env, era_columns):
+#        exit(1)
 #
 #    sync_test_results_dict["identifier"] = sync_test_results_dict["env"] + "_" + str(
 #        int(get_identifier_last_run_from_table(env).split("_")[-1]) + 1)
@@ -124,6 +117,11 @@ def main():
 #            print(f"val_to_insert: {val_to_insert}")
 #            exit(1)
 #
+#        print(f"  ==== Roll up the {env + '_logs'} samples and prune the old raw samples")
+#        create_rollup_tables(env)
+#        rollup_run_samples(env, sync_test_results_dict["identifier"])
+#        prune_raw_samples(env, RAW_SAMPLES_RETENTION_RUNS)
+#
 #        print(f"  ==== Write test values into the {env + '_epoch_duration'} DB table")
 #        sync_duration_values_dict = ast.literal_eval(
 #            str(sync_test_results_dict["sync_duration_per_epoch"]))